@@ -36,10 +36,11 @@ import logging
 import requests
 import argparse
 import getpass
+import atexit
 import threading
-from Queue import Queue
 from secrets import bearer, endpoint, qfile, username, password, useraccs, do_lots
-from flask import Flask
+import secrets
+from flask import Flask, request
 app = Flask(__name__)
 
 
@@ -49,14 +50,84 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 # import Pokemon Go API lib
 from pgoapi import pgoapi
 from pgoapi import utilities as util
+from pgoapi.map_tracker import MapCellTracker
+from pgoapi.cell_cache import CellCache
+from pgoapi.scheduler import ScanScheduler
+from pgoapi.dispatcher import AccountDispatcher
+from pgoapi.job_queue import ScanJobQueue, SqliteJobQueue
+from pgoapi.map_push import MapPusher
+from pgoapi.poi_index import PoiIndex
+from pgoapi.sighting_archive import SightingArchive
+from pgoapi.columnar import ColumnarExporter
+from pgoapi.spawn_learner import SpawnLearner, SpawnScanFeeder
+from pgoapi.scan_planner import plan_scan_points, submit_plan
+from pgoapi.admission import AdmissionController, FULL, MINIMAL
+from pgoapi import metrics
+from pgoapi.records import Fort, WildPokemon
+from pgoapi.dedupe import EncounterDeduper
+from pgoapi.concurrency import ConcurrencyController
+from pgoapi.circuit import EndpointHealth
+from pgoapi.exceptions import CircuitOpenException
+from pgoapi.protobuf_backend import check_backend
 
 # other stuff
+from six.moves.queue import Full
 from google.protobuf.internal import encoder
 from geopy.geocoders import GoogleV3
 from s2sphere import Cell, CellId, LatLng
 
 
-q = Queue()
+# a shared sqlite file keeps queued scans across restarts and between several scanner nodes
+queue_db = getattr(secrets, 'queue_db', None)
+# queued scans from which the endpoints answer 429, internal producers may fill up to twice as many
+max_queue = getattr(secrets, 'max_queue', 1000)
+if queue_db:
+    q = ScanJobQueue(SqliteJobQueue(queue_db), maxsize=2 * max_queue)
+else:
+    q = ScanScheduler(maxsize=2 * max_queue)
+
+# per client token buckets, scan jobs per second and burst size
+admission = AdmissionController(q, high_water=max_queue,
+                                rate=getattr(secrets, 'client_rate', 0.5),
+                                burst=getattr(secrets, 'client_burst', 20))
+
+# hands every job to the available account closest to it
+dispatcher = AccountDispatcher(q)
+
+# overlapping scans return the same wild pokemon, each one is converted and pushed once
+encounters = EncounterDeduper()
+
+# forwards changed map objects in batches, started from __main__, forgets failed pokemon in encounters
+pusher = None
+if bearer != "":
+    pusher = MapPusher("%s/api/push/mapobject/bulk" % endpoint, bearer, encounters=encounters)
+
+# adapts the RPCs in flight per endpoint and per account to busy answers, errors and latency
+concurrency = ConcurrencyController()
+# circuit breaker per api_url, accounts on a failing endpoint log in again or wait for its probe
+endpoint_health = EndpointHealth()
+map_tracker = MapCellTracker()
+cell_cache = CellCache(ttl=30)
+# live forts and wild pokemon of all scans, queried by /nearby
+poi_index = PoiIndex()
+
+# optional sqlite history of all sightings and fort snapshots
+archive_db = getattr(secrets, 'archive_db', None)
+archive = SightingArchive(archive_db) if archive_db else None
+
+# optional chunked numpy export of every GET_MAP_OBJECTS response for offline analysis
+export_dir = getattr(secrets, 'export_dir', None)
+exporter = ColumnarExporter(export_dir) if export_dir else None
+if exporter:
+    atexit.register(exporter.flush)
+
+# scanner metrics served on /metrics next to the RPC and push metrics of pgoapi
+scanner = metrics.ScannerMetrics(q, cell_cache, admission)
+
+# learns the hourly schedule of every seen spawn point, with predictive_scans
+# the cells of spawns which just became active are queued automatically
+spawn_learner = SpawnLearner()
+predictive_scans = getattr(secrets, 'predictive_scans', False)
 NEUTRAL = 0
 BLUE = 1
 RED = 2
@@ -146,6 +217,9 @@ def main():
     # log level for internal pgoapi class
     logging.getLogger("rpc_api").setLevel(logging.INFO)
 
+    # logged again now that logging is set up, strict_protobuf refuses the pure python backend
+    check_backend(getattr(secrets, 'strict_protobuf', None), source='strict_protobuf in secrets.py')
+
     config = init_config()
     if not config:
         return
@@ -166,8 +240,21 @@ def main():
 def get_location(user, psswd, location,pokeOnly):
     splitloc = location.split(",")
     position = (float(splitloc[0]), float(splitloc[1]), 0)
+
+    # answer from the shared cell cache if every cell was fetched moments ago
+    cell_ids = get_cell_ids(position[0], position[1])
+    map_cells, missing = cell_cache.lookup(cell_ids)
+    if not missing:
+        print("Cached %s" % location)
+        handleMapResp({"status": 1, "map_cells": list(map_cells.values())},pokeOnly)
+        return
+
     # instantiate pgoapi 
     api = pgoapi.PGoApi()
+    api.set_concurrency_controller(concurrency, user)
+    api.set_endpoint_health(endpoint_health)
+    if exporter:
+        api.add_response_hook('GET_MAP_OBJECTS', exporter.add_response)
     
     # provide player position on the earth
     api.set_position(*position)
@@ -188,9 +275,8 @@ def get_location(user, psswd, location,pokeOnly):
     # get map objects call
     # repeated fields (e.g. cell_id and since_timestamp_ms in get_map_objects) can be provided over a list
     # ----------------------
-    cell_ids = get_cell_ids(position[0], position[1])
-    timestamps = [0,] * len(cell_ids)
-    api.get_map_objects(latitude = util.f2i(position[0]), longitude = util.f2i(position[1]), since_timestamp_ms = timestamps, cell_id = cell_ids)
+    timestamps = map_tracker.get_since_timestamps(missing)
+    api.get_map_objects(latitude = util.f2i(position[0]), longitude = util.f2i(position[1]), since_timestamp_ms = timestamps, cell_id = missing)
 
     # spin a fort 
     # ----------------------
@@ -209,7 +295,14 @@ def get_location(user, psswd, location,pokeOnly):
     
     # execute the RPC call
     response_dict = api.call()
-    handleMapResp(response_dict["responses"]["GET_MAP_OBJECTS"],pokeOnly)
+    # merge the (incremental) response and hand over the complete view of the requested cells
+    map_objects = response_dict["responses"]["GET_MAP_OBJECTS"]
+    map_tracker.update(map_objects)
+    fetched = map_tracker.get_cells(missing)
+    cell_cache.put_many(fetched)
+    if archive:
+        archive.record(fetched)
+    handleMapResp({"status": map_objects.get("status"), "map_cells": list(map_cells.values()) + fetched},pokeOnly)
     #api.get_map_objects(latitude = util.f2i(position[0]), longitude = util.f2i(position[1]), since_timestamp_ms = timestamps, cell_id = cell_ids)
     #response_dict = api.call()
     #handleMapResp(response_dict["responses"]["GET_MAP_OBJECTS"],pokeOnly)
@@ -222,64 +315,19 @@ def handleMapResp(respdict,pokeOnly):
     pokemonsJSON = json.load(
         open("pokenames.json"))
     bulk = []
+    poi_index.add_map_cells(respdict["map_cells"])
+    spawn_learner.observe_map_cells(respdict["map_cells"])
     for cell in respdict["map_cells"]:
-        if "forts" in cell:
-            for fort in cell["forts"]:
-                props = {
-                    "id": fort["id"],
-                    "LastModifiedMs": fort["last_modified_timestamp_ms"]
-                    }
-
-                p = {"type": "Point", "coordinates": [fort["longitude"],fort["latitude"]]}
-                if "type" in fort:
-                  props["marker-symbol"] = "circle"
-                  props["title"] = "PokeStop"
-                  props["type"] = "pokestop"
-                  props["lure"] = "lure_info" in fort
-                else:
-                  props["marker-symbol"] = "town-hall"
-                  props["marker-size"] = "large"
-                  props["type"] = "gym"
-
-                if "owned_by_team" in fort:
-                   if fort["owned_by_team"] == BLUE:
-                     props["marker-color"] = "0000FF"
-                     props["title"] = "Blue Gym"
-                   elif fort["owned_by_team"] == RED:
-                     props["marker-color"] = "FF0000"
-                     props["title"] = "Red Gym"
-                   elif fort["owned_by_team"] == YELLOW:
-                     props["marker-color"] = "FF0000"
-                     props["title"] = "Yellow Gym"
-                else:
-                    if "lure_info" in fort:
-                        print("This should have lure info")
-                        print(fort)
-                        props["lure"] = True
-                        props["lure_info"] = fort["lure_info"]
-                        t = createItem(props["type"], fort["id"], p, props)
-                        print(t)
-                    props["marker-color"] = "808080"
-                if not pokeOnly:
-                    bulk.append(createItem(props["type"], fort["id"], p, props))
-            
-        if "wild_pokemons" in cell:
-            for pokemon in cell["wild_pokemons"]:
-                pokeid = pokemon["pokemon_data"]["pokemon_id"]
-                pokename = pokemonsJSON[str(pokeid)]
-                f = {
-                  "id": "wild%s" % pokemon["encounter_id"],
-                  "type": "wild",
-                  "pokemonNumber": pokeid,
-                  "TimeTillHiddenMs": pokemon["time_till_hidden_ms"],
-                  "WillDisappear": pokemon["time_till_hidden_ms"] + cell["current_timestamp_ms"],
-                  "title": "Wild %s" %pokename,
-                  "marker-color": "FF0000"
-                  }
-                p = {"type": "Point", "coordinates": [pokemon["longitude"], pokemon["latitude"]]}
-
-                bulk.append(createItem("pokemon", pokemon["encounter_id"], p, f))
-                print("Added %s" % pokemon["encounter_id"])
+        if not pokeOnly:
+            for fort in cell.get("forts", []):
+                bulk.append(Fort.from_dict(fort).to_push_item())
+
+        now_ms = cell.get("current_timestamp_ms")
+        for pokemon in cell.get("wild_pokemons", []):
+            if encounters.seen(pokemon["encounter_id"]):
+                continue
+            bulk.append(WildPokemon.from_dict(pokemon, now_ms).to_push_item(pokemonsJSON, now_ms))
+            print("Added %s" % pokemon["encounter_id"])
     dumpToMap(bulk)
     return
 
@@ -288,12 +336,12 @@ def createItem(dataType, uid, location, properties=None):
     return item
 
 def dumpToMap(data):
-    if bearer == "":
+    if pusher is None:
         return
     if len(data) == 0:
         return
-    headers = {"Authorization" : "Bearer %s" % bearer}
-    r = requests.post("%s/api/push/mapobject/bulk" % endpoint, json = data, headers = headers)
+    # only new or changed objects are queued, the pusher posts them in batches
+    pusher.submit(data)
 
 skipQueue=True
 def updateQueueFile():
@@ -309,20 +357,44 @@ def updateQueueFile():
     except:
         skipQueue = True
 def working():
-    while True:
-        item,pokeOnly = q.get()
-        print("Getting location for %s" % item)
-        get_location(username,password,item, pokeOnly)
-        updateQueueFile()
+    working_acct(username)
 
 def working_acct(user):
+    position = getattr(secrets, 'default_position', (0, 0, 0))
+    dispatcher.register(user, position[0], position[1])
+    try:
+        scan_jobs(user)
+    finally:
+        # a dead worker must not keep its assigned jobs or receive new ones
+        dispatcher.unregister(user)
+
+def scan_jobs(user):
     while True:
-        item,pokeOnly = q.get()
+        job = dispatcher.get(user)
+        item = "%s,%s" % (job.lat, job.lng)
         print("Getting location for %s" % item)
-        get_location(user,password,item,pokeOnly)
+        start = time.time()
+        try:
+            get_location(user,password,item,job.kind)
+            scanner.scans.labels(user, 'success').inc()
+            scanner.scan_duration.observe(time.time() - start)
+        except CircuitOpenException as e:
+            # every job logs in again, after the wait the login may get a healthy endpoint
+            print(e)
+            scanner.scans.labels(user, 'circuit_open').inc()
+            q.retry(job)
+            scanner.cooldown(user, e.retry_after, 'circuit_open')
+            continue
+        except Exception:
+            scanner.scans.labels(user, 'error').inc()
+            q.task_done(job)
+            admission.completed()
+            raise
+        q.task_done(job)
+        admission.completed()
         updateQueueFile()
 
-def get_surrounding(lat,lon):
+def get_surrounding(lat,lon,diagonals=True):
     #conversions
     #1 deg lat 110.574 km
     #1 degree lon = 111.320*cos(latitude) km
@@ -333,50 +405,114 @@ def get_surrounding(lat,lon):
     minus_lat = (lat-0.00180874346, lon)
     plus_lon = (lat,lon+movement_lon)
     minus_lon = (lat,lon-movement_lon)
+    points = [plus_lat,minus_lat,plus_lon,minus_lon]
     if do_lots:
-        plus_both = (lat+0.00180874346, lon+movement_lon)
-        pm_both = (lat+0.00180874346, lon-movement_lon)
-        mp_both = (lat-0.00180874346, lon+movement_lon)
-        minus_both = (lat-0.00180874346, lon-movement_lon)
-        return [plus_lat,minus_lat,plus_lon,minus_lon,plus_both,pm_both,mp_both,minus_both,(lat,lon)]
-    return [plus_lat,minus_lat,plus_lon,minus_lon]
+        if diagonals:
+            plus_both = (lat+0.00180874346, lon+movement_lon)
+            pm_both = (lat+0.00180874346, lon-movement_lon)
+            mp_both = (lat-0.00180874346, lon+movement_lon)
+            minus_both = (lat-0.00180874346, lon-movement_lon)
+            points += [plus_both,pm_both,mp_both,minus_both]
+        points.append((lat,lon))
+    return points
+
 
 
+def busy(retry_after):
+    return json.dumps({"error": "busy", "retry_after": retry_after}), 429, {"Retry-After": "%s" % retry_after}
 
 @app.route("/")
 def retQueue():
   size = q.qsize()
   return "%s" % size
-prevreq = []
+
+@app.route("/metrics")
+def metricsPage():
+  return metrics.exposition(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+@app.route("/cacheStats")
+def cacheStats():
+  return json.dumps(cell_cache.stats())
+
+@app.route("/pushStats")
+def pushStats():
+  return json.dumps(pusher.stats() if pusher else {})
+
+@app.route('/nearby/<lat>/<lon>')
+@app.route('/nearby/<lat>/<lon>/<radius>')
+def nearby(lat,lon,radius=200):
+    lat, lon, radius = float(lat), float(lon), float(radius)
+    return json.dumps({
+        "pokemons": poi_index.query_radius(lat, lon, radius, kind="pokemon"),
+        "forts": poi_index.query_radius(lat, lon, radius, kind="fort"),
+        })
+
+@app.route("/archiveStats")
+def archiveStats():
+  return json.dumps(archive.stats() if archive else {})
+
+@app.route("/spawnStats")
+def spawnStats():
+  return json.dumps(spawn_learner.stats())
+
+@app.route('/scanSpawns')
+def scanSpawns():
+    # queue the fewest scans covering every known spawn point
+    plan = plan_scan_points([(lat, lng) for spawnpoint_id, lat, lng in spawn_learner.spawn_points()])
+    try:
+        submit_plan(q, plan, kind=True)
+    except Full:
+        return busy(admission.retry_after(len(plan)))
+    updateQueueFile()
+    return "Queued %s scans, queue is %s" % (len(plan), q.qsize())
+
+@app.route("/admissionStats")
+def admissionStats():
+  return json.dumps(admission.stats())
+
+@app.route("/dedupeStats")
+def dedupeStats():
+  return json.dumps(encounters.stats())
+
+@app.route("/concurrencyStats")
+def concurrencyStats():
+  return json.dumps(concurrency.stats())
+
+@app.route("/circuitStats")
+def circuitStats():
+  return json.dumps(endpoint_health.stats())
+
+@app.route("/schedulerStats")
+def schedulerStats():
+  return json.dumps(q.stats())
 
 @app.route('/addPokemon/<lat>/<lon>')
 def addPokemon(lat,lon):
-    global prevreq
-    if (lat,lon) in prevreq:
-        print("They suck")
-        return "You suck"
     if abs(float(lon)) > 180:
         return "Too big!"
-    if len(prevreq) >=20:
-        prevreq.pop()
-    prevreq.append((lat,lon))
-    for nlat, nlon in get_surrounding(float(lat),float(lon)):
-        q.put(("%s,%s"%(float(nlat),float(nlon)), True))
+    lat, lon = float(lat), float(lon)
+    # under load the diagonal points are dropped first, then the whole ring
+    coverage = admission.coverage()
+    if coverage == MINIMAL:
+        points = [(lat, lon)]
+    else:
+        points = get_surrounding(lat, lon, coverage == FULL)
+    admitted, retry_after = admission.admit(request.remote_addr, len(points))
+    if not admitted:
+        return busy(retry_after)
+    for nlat, nlon in points:
+        q.put(float(nlat), float(nlon), priority=1, kind=True)
     updateQueueFile()
     return "Queue is %s"% q.qsize()
 
 @app.route('/addToQueue/<lat>/<lon>')
 def addToQueue(lat,lon):
-    global prevreq
-    if (lat,lon) in prevreq:
-        print("They suck")
-        return "You suck"
     if abs(float(lon)) > 180:
         return "Too big!"
-    if len(prevreq) >=20:
-        prevreq.pop()
-    prevreq.append((lat,lon))
-    q.put(("%s,%s"%(float(lat),float(lon)), False))
+    admitted, retry_after = admission.admit(request.remote_addr)
+    if not admitted:
+        return busy(retry_after)
+    q.put(float(lat), float(lon), kind=False)
     updateQueueFile()
     return "Queue is %s"% q.qsize()
 
@@ -387,6 +523,10 @@ if __name__ == '__main__':
         t = threading.Thread(target=working_acct, args=(acct,))
         t.daemon = True
         t.start()
+    if pusher:
+        pusher.start()
+    if predictive_scans:
+        SpawnScanFeeder(spawn_learner, q, kind=True).start()
     app.run(host="0.0.0.0")
 
 # vim: set sw=4 ts=4 expandtab : #
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+# asyncio replacement for the flask front-end of new_server.py (Python 3.7+).
+#
+#   GET /addPokemon/<lat>/<lon>      queue a pokemon scan, returns {"job": <id>, "queue": <size>}
+#   GET /addToQueue/<lat>/<lon>      queue a fort scan
+#   GET /jobs/<id>/events            every scanned map cell as Server-Sent Event
+#   GET /jobs/<id>/lines             the same as chunked JSON lines
+#   GET /                            queue size
+
+import re
+import json
+import asyncio
+import logging
+import itertools
+
+from secrets import bearer, endpoint, password, useraccs, default_position
+
+from pgoapi.aio import AsyncPGoApi
+from pgoapi.map_tracker import MapCellTracker
+from pgoapi.cell_cache import CellCache
+from pgoapi.map_push import MapPusher
+from pgoapi.records import Fort, WildPokemon
+from pgoapi.utilities import generate_spiral
+
+log = logging.getLogger(__name__)
+
+# the scan geometry of new_server.find_poi: 49 spiral steps for pokemon, the center for forts
+STEP_SIZE = 0.0010
+POKEMON_STEPS = 49
+FORT_STEPS = 1
+# finished jobs stay available for late subscribers
+JOB_TTL = 300
+
+map_tracker = MapCellTracker()
+cell_cache = CellCache(ttl=30)
+
+pusher = None
+if bearer != "":
+    pusher = MapPusher("%s/api/push/mapobject/bulk" % endpoint, bearer)
+
+jobs = {}
+job_ids = itertools.count(1)
+queue = None
+
+
+class Job(object):
+
+    def __init__(self, job_id, lat, lng, pokeOnly):
+        self.id = job_id
+        self.lat = lat
+        self.lng = lng
+        self.pokeOnly = pokeOnly
+        self.events = []
+        self.done = False
+        self.cond = asyncio.Condition()
+
+    async def publish(self, event, done=False):
+        async with self.cond:
+            self.events.append(event)
+            self.done = done
+            self.cond.notify_all()
+
+    async def subscribe(self):
+        index = 0
+        while True:
+            async with self.cond:
+                while index >= len(self.events) and not self.done:
+                    await self.cond.wait()
+                events = self.events[index:]
+                done = self.done
+            for event in events:
+                yield event
+            index += len(events)
+            if done and index >= len(self.events):
+                return
+
+
+def scan_points(lat, lng, pokeOnly):
+    coords = generate_spiral(lat, lng, STEP_SIZE, POKEMON_STEPS if pokeOnly else FORT_STEPS)
+    return [(coord["lat"], coord["lng"]) for coord in coords]
+
+
+async def scan(api, job):
+    points = scan_points(job.lat, job.lng, job.pokeOnly)
+    async for cell in api.scan(points, cache=cell_cache, tracker=map_tracker):
+        pokemons = cell.get("wild_pokemons", [])
+        forts = [] if job.pokeOnly else cell.get("forts", [])
+        await job.publish({"job": job.id, "cell": cell["s2_cell_id"], "pokemons": pokemons, "forts": forts})
+        if pusher:
+            # the pusher drops everything it forwarded before
+            items = [WildPokemon.from_dict(pokemon, cell.get("current_timestamp_ms")).to_push_item()
+                     for pokemon in pokemons]
+            items += [Fort.from_dict(fort).to_push_item() for fort in forts]
+            if items:
+                pusher.submit(items)
+
+
+async def worker(user):
+    api = AsyncPGoApi()
+    if not await api.login('ptc', user, password, default_position):
+        log.error("%s could not log in", user)
+        return
+    log.info("%s logged in", user)
+
+    while True:
+        priority, seq, job = await queue.get()
+        try:
+            await scan(api, job)
+        except Exception as e:
+            log.warning("Scan of job %s failed: %s", job.id, e)
+            await job.publish({"job": job.id, "error": str(e)})
+        await job.publish({"job": job.id, "done": True}, done=True)
+        asyncio.get_event_loop().call_later(JOB_TTL, jobs.pop, job.id, None)
+
+
+async def submit(lat, lng, pokeOnly):
+    job = Job(next(job_ids), lat, lng, pokeOnly)
+    jobs[job.id] = job
+    await queue.put((0 if pokeOnly else 1, job.id, job))
+    return {"job": job.id, "queue": queue.qsize()}
+
+
+async def respond(writer, status, body, content_type="application/json"):
+    body = body.encode("utf-8")
+    writer.write(("HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %s\r\nConnection: close\r\n\r\n"
+                  % (status, content_type, len(body))).encode("utf-8") + body)
+    await writer.drain()
+
+
+async def stream(writer, job, sse):
+    # every event is flushed as soon as it is published
+    if sse:
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+    else:
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+
+    async for event in job.subscribe():
+        data = json.dumps(event)
+        if sse:
+            writer.write(("data: %s\n\n" % data).encode("utf-8"))
+        else:
+            line = (data + "\n").encode("utf-8")
+            writer.write(("%x\r\n" % len(line)).encode("utf-8") + line + b"\r\n")
+        await writer.drain()
+
+    if not sse:
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+ROUTES = [
+    (re.compile(r"^/addPokemon/([-\d.]+)/([-\d.]+)$"), "addPokemon"),
+    (re.compile(r"^/addToQueue/([-\d.]+)/([-\d.]+)$"), "addToQueue"),
+    (re.compile(r"^/jobs/(\d+)/(events|lines)$"), "job"),
+    (re.compile(r"^/$"), "queue"),
+]
+
+
+async def handle(reader, writer):
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        # skip the headers, nothing in them is used
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        if len(request_line) < 2:
+            return
+
+        path = request_line[1].split("?", 1)[0]
+        for pattern, route in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return await respond(writer, "404 Not Found", json.dumps({"error": "not found"}))
+
+        if route in ("addPokemon", "addToQueue"):
+            try:
+                lat, lng = float(match.group(1)), float(match.group(2))
+            except ValueError:
+                return await respond(writer, "400 Bad Request", json.dumps({"error": "invalid location"}))
+            if abs(lng) > 180:
+                return await respond(writer, "400 Bad Request", json.dumps({"error": "Too big!"}))
+            return await respond(writer, "200 OK", json.dumps(await submit(lat, lng, route == "addPokemon")))
+
+        if route == "job":
+            job = jobs.get(int(match.group(1)))
+            if job is None:
+                return await respond(writer, "404 Not Found", json.dumps({"error": "unknown job"}))
+            return await stream(writer, job, match.group(2) == "events")
+
+        return await respond(writer, "200 OK", "%s" % queue.qsize(), "text/plain")
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main(host="0.0.0.0", port=5000):
+    global queue
+    queue = asyncio.PriorityQueue()
+
+    for user in useraccs:
+        asyncio.ensure_future(worker(user))
+    if pusher:
+        pusher.start()
+
+    server = await asyncio.start_server(handle, host, port)
+    log.info("Listening on %s:%s", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(module)10s] [%(levelname)5s] %(message)s')
+    logging.getLogger("requests").setLevel(logging.WARNING)
+    asyncio.run(main())
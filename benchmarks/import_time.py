@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Startup cost of pgoapi: every step runs in a fresh interpreter, as it does for
+pokecli.py and every forked scan worker.
+
+    python benchmarks/import_time.py [--runs 10]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+CHILD = r'''
+import sys, json, time
+start = time.time()
+import pgoapi
+imported = time.time()
+
+from pgoapi.rpc_api import RpcApi, RequestEnvelope, RequestType
+rpc = RpcApi(None)
+rpc._build_sub_requests(RequestEnvelope(), [{RequestType.Value('GET_MAP_OBJECTS'): {'cell_id': [1], 'since_timestamp_ms': [0]}}])
+rpc.get_class('POGOProtos.Networking.Responses_pb2.GetMapObjectsResponse')
+first_request = time.time()
+
+json.dump({
+    'import': imported - start,
+    'first_request': first_request - imported,
+    'proto_modules_after_import': MODULES_AFTER_IMPORT,
+    'proto_modules_after_request': len([m for m in sys.modules if m.startswith('POGOProtos.')]),
+}, sys.stdout)
+'''
+
+
+def run_child(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    # counted right after "import pgoapi", before anything is used
+    code = CHILD.replace('imported = time.time()\n', 'imported = time.time()\n'
+                         'MODULES_AFTER_IMPORT = sorted(m for m in sys.modules if m.startswith("POGOProtos."))\n')
+    results = [run_child(code) for i in range(args.runs)]
+
+    print('python {} - {} runs, median'.format(sys.version.split()[0], args.runs))
+    print('  import pgoapi                    {:8.1f} ms'.format(median([r['import'] for r in results]) * 1000))
+    print('  first GET_MAP_OBJECTS request    {:8.1f} ms'.format(median([r['first_request'] for r in results]) * 1000))
+    print('  proto modules loaded by import:  {}'.format(', '.join(results[0]['proto_modules_after_import']) or 'none'))
+    print('  proto modules loaded by request: {}'.format(results[0]['proto_modules_after_request']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Wild pokemon extraction from GetMapObjectsResponse payloads: the full protobuf
+parse against the wire level reader of pgoapi.wire.
+
+    python benchmarks/map_objects_parse.py [--runs 200] [payload ...]
+
+Payloads are serialized GetMapObjectsResponse messages, e.g. recorded with
+
+    api.add_response_hook('GET_MAP_OBJECTS', lambda r: open(path, 'wb').write(r.SerializeToString()))
+
+Without payloads a response of 21 cells with typical city content is generated.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from pgoapi import wire
+from pgoapi.protos import get_class
+from pgoapi.records import WildPokemon
+from pgoapi.protobuf_to_dict import protobuf_to_dict
+
+GetMapObjectsResponse = 'POGOProtos.Networking.Responses_pb2.GetMapObjectsResponse'
+
+
+def generate_payload(cells=21, forts=6, spawn_points=12, pokemons=4, seed=1):
+    rand = random.Random(seed)
+    response = get_class(GetMapObjectsResponse)()
+    response.status = 1
+    for c in range(cells):
+        cell = response.map_cells.add()
+        cell.s2_cell_id = 9937309294603010048 + c * 2 ** 31
+        cell.current_timestamp_ms = 1470000000000 + c
+        for f in range(forts):
+            fort = cell.forts.add()
+            fort.id = '%032x.16' % rand.getrandbits(128)
+            fort.last_modified_timestamp_ms = 1469990000000 + f
+            fort.latitude = 40.0 + rand.random() / 100
+            fort.longitude = -73.0 + rand.random() / 100
+            fort.type = f % 2
+            fort.owned_by_team = f % 4
+            fort.guard_pokemon_id = rand.randint(1, 151)
+            fort.gym_points = rand.randint(0, 50000)
+        for s in range(spawn_points):
+            spawn_point = cell.spawn_points.add()
+            spawn_point.latitude = 40.0 + rand.random() / 100
+            spawn_point.longitude = -73.0 + rand.random() / 100
+        for p in range(pokemons):
+            pokemon = cell.wild_pokemons.add()
+            pokemon.encounter_id = rand.getrandbits(64)
+            pokemon.last_modified_timestamp_ms = 1469999000000 + p
+            pokemon.latitude = 40.0 + rand.random() / 100
+            pokemon.longitude = -73.0 + rand.random() / 100
+            pokemon.spawnpoint_id = '%x' % rand.getrandbits(40)
+            pokemon.pokemon_data.pokemon_id = rand.randint(1, 151)
+            pokemon.time_till_hidden_ms = rand.randint(-1, 900000)
+            nearby = cell.catchable_pokemons.add()
+            nearby.encounter_id = pokemon.encounter_id
+            nearby.pokemon_id = pokemon.pokemon_data.pokemon_id
+            nearby.latitude = pokemon.latitude
+            nearby.longitude = pokemon.longitude
+    return response.SerializeToString()
+
+
+def protobuf_dict(payload):
+    response = get_class(GetMapObjectsResponse)()
+    response.ParseFromString(payload)
+    return protobuf_to_dict(response)
+
+
+def protobuf_records(payload):
+    response = get_class(GetMapObjectsResponse)()
+    response.ParseFromString(payload)
+    now_ms = int(time.time() * 1000)
+    return [WildPokemon.from_proto(pokemon, now_ms) for cell in response.map_cells for pokemon in cell.wild_pokemons]
+
+
+def check(payload):
+    # the wire reader has to agree with the protobuf runtime on every pokemon
+    expected = [(p.encounter_id, p.spawnpoint_id, p.pokemon_id, p.latitude, p.longitude, p.disappear_ms)
+                for p in [WildPokemon.from_dict(pokemon, cell.get('current_timestamp_ms'))
+                          for cell in protobuf_dict(payload).get('map_cells', [])
+                          for pokemon in cell.get('wild_pokemons', [])]]
+    actual = [(p.encounter_id, p.spawnpoint_id, p.pokemon_id, p.latitude, p.longitude, p.disappear_ms)
+              for p in wire.wild_pokemons(payload)]
+    if expected != actual:
+        raise SystemExit('wire.wild_pokemons does not match the protobuf parse')
+    return len(actual)
+
+
+def measure(func, payloads, runs):
+    best = None
+    for i in range(5):
+        start = time.time()
+        for run in range(runs):
+            for payload in payloads:
+                func(payload)
+        elapsed = (time.time() - start) / (runs * len(payloads))
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('payloads', nargs='*')
+    args = parser.parse_args()
+
+    if args.payloads:
+        payloads = []
+        for path in args.payloads:
+            with open(path, 'rb') as f:
+                payloads.append(f.read())
+    else:
+        payloads = [generate_payload()]
+
+    pokemons = sum(check(payload) for payload in payloads)
+    size = sum(len(payload) for payload in payloads) / len(payloads)
+
+    from google.protobuf.internal import api_implementation
+    print('python {}, protobuf {} backend - {} payloads, {:.0f} bytes and {} wild pokemon on average'.format(
+        sys.version.split()[0], api_implementation.Type(), len(payloads), size, pokemons // len(payloads)))
+
+    cases = [
+        ('ParseFromString + protobuf_to_dict', protobuf_dict),
+        ('ParseFromString + WildPokemon', protobuf_records),
+        ('wire.wild_pokemons', wire.wild_pokemons),
+    ]
+    try:
+        import numpy
+        cases.append(('wire.wild_pokemon_array', wire.wild_pokemon_array))
+    except ImportError:
+        pass
+
+    baseline = None
+    for name, func in cases:
+        elapsed = measure(func, payloads, args.runs)
+        baseline = baseline or elapsed
+        print('  {:36} {:9.1f} us  {:5.1f}x'.format(name, elapsed * 1e6, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
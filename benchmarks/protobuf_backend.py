@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+ParseFromString, SerializeToString and protobuf_to_dict on the POGOProtos
+messages of a scan, once per protobuf backend. Every backend runs in a fresh
+interpreter with PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION set, backends the
+installed protobuf does not ship are reported as unavailable.
+
+    python benchmarks/protobuf_backend.py [--runs 50] [--backends python,cpp,upb]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+BENCHMARKS = os.path.join(ROOT, 'benchmarks')
+
+CHILD = r'''
+import sys, json, time
+from pgoapi.protobuf_backend import get_backend
+from pgoapi.protos import get_class
+from pgoapi.protobuf_to_dict import protobuf_to_dict
+from pgoapi.rpc_api import RpcApi, RequestEnvelope, RequestType
+from pgoapi.utilities import f2i
+from map_objects_parse import generate_payload
+
+RUNS = %(runs)d
+
+def measure(func):
+    best = None
+    for i in range(5):
+        start = time.time()
+        for run in range(RUNS):
+            func()
+        elapsed = (time.time() - start) / RUNS
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+payload = generate_payload()
+response = get_class('POGOProtos.Networking.Responses_pb2.GetMapObjectsResponse')()
+response.ParseFromString(payload)
+
+cells = list(range(9937309294603010048, 9937309294603010048 + 21))
+request = RpcApi(None)._build_sub_requests(RequestEnvelope(), [
+    {RequestType.Value('GET_MAP_OBJECTS'): {'cell_id': cells, 'since_timestamp_ms': [0] * len(cells),
+                                            'latitude': f2i(40.0), 'longitude': f2i(-73.0)}}])
+request.status_code = 2
+request.request_id = 8145806132888207460
+
+def parse():
+    get_class('POGOProtos.Networking.Responses_pb2.GetMapObjectsResponse')().ParseFromString(payload)
+
+json.dump({
+    'backend': get_backend(),
+    'bytes': len(payload),
+    'ParseFromString': measure(parse),
+    'SerializeToString': measure(response.SerializeToString),
+    'protobuf_to_dict': measure(lambda: protobuf_to_dict(response)),
+    'request SerializeToString': measure(request.SerializeToString),
+}, sys.stdout)
+'''
+
+CASES = ['ParseFromString', 'SerializeToString', 'protobuf_to_dict', 'request SerializeToString']
+
+
+def run_backend(backend, runs):
+    env = dict(os.environ)
+    env['PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION'] = backend
+    # strict mode would refuse the python baseline
+    env.pop('PGOAPI_STRICT_PROTOBUF', None)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, BENCHMARKS, env.get('PYTHONPATH', '')])
+    process = subprocess.Popen([sys.executable, '-c', CHILD % {'runs': runs}], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = process.communicate()
+    if process.returncode != 0:
+        lines = error.decode('utf-8', 'replace').strip().splitlines()
+        return None, lines[-1] if lines else 'exit code {}'.format(process.returncode)
+    result = json.loads(output.decode('utf-8'))
+    if result['backend'] != backend:
+        # protobuf falls back silently on some versions
+        return None, 'protobuf chose {} instead'.format(result['backend'])
+    return result, None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--backends', default='python,cpp,upb')
+    args = parser.parse_args()
+
+    results = []
+    for backend in args.backends.split(','):
+        result, error = run_backend(backend, args.runs)
+        if result is None:
+            print('{:8} not available: {}'.format(backend, error))
+        else:
+            results.append(result)
+
+    if not results:
+        return
+    print('python {} - GetMapObjectsResponse of {} bytes, best of 5 x {} runs'.format(
+        sys.version.split()[0], results[0]['bytes'], args.runs))
+    print('  {:28}'.format('') + ''.join('{:>12}'.format(result['backend']) for result in results))
+    for case in CASES:
+        baseline = results[0][case]
+        print('  {:28}'.format(case) + ''.join(
+            '{:>9.0f} us'.format(result[case] * 1e6) for result in results) +
+            ''.join('  {:4.1f}x'.format(baseline / result[case]) for result in results[1:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Peak memory and time of one RPC from the HTTP body to the response dict,
+measured with tracemalloc around RpcApi.request() against a canned response.
+
+    python benchmarks/rpc_memory.py [--runs 20] [--cells 21] [--raw]
+
+--raw decodes GET_MAP_OBJECTS with pgoapi.wire instead of the protobuf parse.
+"""
+
+from __future__ import print_function
+
+import io
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import requests
+
+from pgoapi import wire
+from pgoapi.rpc_api import RpcApi, ResponseEnvelope, RequestType
+from pgoapi.utilities import f2i
+
+from map_objects_parse import generate_payload
+
+
+class FakeAuth(object):
+
+    def is_login(self):
+        return True
+
+    def get_name(self):
+        return 'ptc'
+
+    def get_token(self):
+        return 'TGT-1-benchmark'
+
+
+class FakeSession(object):
+
+    def __init__(self, body):
+        self._body = body
+
+    def post(self, endpoint, data=None, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Length'] = str(len(self._body))
+        response.raw = io.BytesIO(self._body)
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--cells', type=int, default=21)
+    parser.add_argument('--raw', action='store_true')
+    args = parser.parse_args()
+
+    envelope = ResponseEnvelope()
+    envelope.status_code = 1
+    envelope.request_id = 8145806132888207460
+    envelope.api_url = 'pgorelease.nianticlabs.com/plfe/403'
+    envelope.returns.append(generate_payload(cells=args.cells))
+    body = envelope.SerializeToString()
+
+    gmo = RequestType.Value('GET_MAP_OBJECTS')
+    raw_handlers = {gmo: wire.wild_pokemons} if args.raw else None
+    subrequests = [{gmo: {'cell_id': [1], 'since_timestamp_ms': [0]}}]
+    position = (f2i(40.0), f2i(-73.0), 0)
+
+    rpc = RpcApi(FakeAuth(), raw_handlers=raw_handlers)
+    rpc._session = FakeSession(body)
+
+    # the first call loads the protos and allocates the receive buffer
+    rpc.request('https://localhost/rpc', subrequests, position)
+
+    peaks = []
+    elapsed = []
+    for i in range(args.runs):
+        tracemalloc.start()
+        start = time.time()
+        response = rpc.request('https://localhost/rpc', subrequests, position)
+        elapsed.append(time.time() - start)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+        del response
+
+    peaks.sort()
+    elapsed.sort()
+    print('response body {} bytes, {} runs, median'.format(len(body), args.runs))
+    print('  peak memory per call  {:10.0f} bytes  {:5.1f}x body'.format(peaks[len(peaks) // 2], peaks[len(peaks) // 2] / float(len(body))))
+    print('  time per call         {:10.1f} ms (traced)'.format(elapsed[len(elapsed) // 2] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -30,29 +30,102 @@ import sys
 import json
 import time
 import struct
-import random
 import logging
 import requests
 import argparse
 import threading
-from Queue import Queue
+import multiprocessing.util
 from secrets import bearer, endpoint, username, password, useraccs, do_lots, default_position
-from flask import Flask
+import secrets
+from flask import Flask, request
 app = Flask(__name__)
 
 from pgoapi import PGoApi
-from pgoapi.utilities import f2i, h2f
+from pgoapi.utilities import generate_spiral
+from pgoapi.map_tracker import MapCellTracker
+from pgoapi.cell_cache import CellCache
+from pgoapi.scheduler import ScanScheduler
+from pgoapi.dispatcher import AccountDispatcher
+from pgoapi.job_queue import ScanJobQueue, SqliteJobQueue
+from pgoapi.map_push import MapPusher
+from pgoapi.poi_index import PoiIndex
+from pgoapi.sighting_archive import SightingArchive
+from pgoapi.columnar import ColumnarExporter
+from pgoapi.sharding import ShardSupervisor
+from pgoapi.admission import AdmissionController
+from pgoapi import metrics
+from pgoapi.records import Fort, WildPokemon
+from pgoapi.dedupe import EncounterDeduper
+from pgoapi.concurrency import ConcurrencyController
+from pgoapi.circuit import EndpointHealth
+from pgoapi.exceptions import CircuitOpenException
+from pgoapi.protobuf_backend import check_backend
 
-from google.protobuf.internal import encoder
 from geopy.geocoders import GoogleV3
-from s2sphere import Cell, CellId, LatLng
 
 NEUTRAL = 0
 BLUE = 1
 RED = 2
 YELLOW = 3
 log = logging.getLogger(__name__)
-q = Queue()
+# a shared sqlite file keeps queued scans across restarts and between several scanner nodes
+queue_db = getattr(secrets, 'queue_db', None)
+# queued scans from which the endpoints answer 429, internal producers may fill up to twice as many
+max_queue = getattr(secrets, 'max_queue', 1000)
+if queue_db:
+    q = ScanJobQueue(SqliteJobQueue(queue_db), maxsize=2 * max_queue)
+else:
+    q = ScanScheduler(maxsize=2 * max_queue)
+
+# per client token buckets, scan jobs per second and burst size
+admission = AdmissionController(q, high_water=max_queue,
+                                rate=getattr(secrets, 'client_rate', 0.5),
+                                burst=getattr(secrets, 'client_burst', 20))
+
+# hands every job to the available account closest to it
+dispatcher = AccountDispatcher(q)
+
+# overlapping scans return the same wild pokemon, each one is converted and pushed once
+encounters = EncounterDeduper()
+
+# forwards changed map objects in batches, started from __main__, forgets failed pokemon in encounters
+pusher = None
+if bearer != "":
+    pusher = MapPusher("%s/api/push/mapobject/bulk" % endpoint, bearer, encounters=encounters)
+
+# number of scan processes, 0 keeps all workers as threads in this process
+worker_processes = getattr(secrets, 'worker_processes', 0)
+# adapts the RPCs in flight per endpoint and per account to busy answers, errors and latency
+threads_per_account = getattr(secrets, 'threads_per_account', 1)
+concurrency = ConcurrencyController(account_limits=(1, 1, threads_per_account))
+# circuit breaker per api_url, accounts on a failing endpoint log in again or wait for its probe
+endpoint_health = EndpointHealth()
+map_tracker = MapCellTracker()
+cell_cache = CellCache(ttl=30)
+# live forts and wild pokemon of all scans, queried by /nearby
+poi_index = PoiIndex()
+
+# optional sqlite history of all sightings and fort snapshots
+archive_db = getattr(secrets, 'archive_db', None)
+archive = SightingArchive(archive_db) if archive_db else None
+
+# optional chunked numpy export of every GET_MAP_OBJECTS response for offline analysis
+export_dir = getattr(secrets, 'export_dir', None)
+# created by the process which scans, the shard processes write their own chunks
+exporter = None
+exporter_lock = threading.Lock()
+
+def get_exporter():
+    global exporter
+    with exporter_lock:
+        if exporter is None and export_dir:
+            exporter = ColumnarExporter(export_dir, writer="p%s" % os.getpid())
+            # atexit does not run in multiprocessing children, their finalizers do
+            multiprocessing.util.Finalize(None, exporter.flush, exitpriority=10)
+        return exporter
+
+# scanner metrics served on /metrics next to the RPC and push metrics of pgoapi
+scanner = metrics.ScannerMetrics(q, cell_cache, admission)
 
 def get_pos_by_name(location_name):
     geolocator = GoogleV3()
@@ -63,26 +136,6 @@ def get_pos_by_name(location_name):
 
     return (loc.latitude, loc.longitude, loc.altitude)
 
-def get_cellid(lat, long):
-    origin = CellId.from_lat_lng(LatLng.from_degrees(lat, long)).parent(15)
-    walk = [origin.id()]
-
-    # 10 before and 10 after
-    next = origin.next()
-    prev = origin.prev()
-    for i in range(10):
-        walk.append(prev.id())
-        walk.append(next.id())
-        next = next.next()
-        prev = prev.prev()
-    return sorted(walk)
-    #return ''.join(map(encode, sorted(walk)))
-
-def encode(cellid):
-    output = []
-    encoder._VarintEncoder()(output.append, cellid)
-    return ''.join(output)
-
 def init_config():
     parser = argparse.ArgumentParser()
     config_file = "config.json"
@@ -127,6 +180,9 @@ def main():
     # log level for internal pgoapi class
     logging.getLogger("rpc_api").setLevel(logging.INFO)
 
+    # logged again now that logging is set up, strict_protobuf refuses the pure python backend
+    check_backend(getattr(secrets, 'strict_protobuf', None), source='strict_protobuf in secrets.py')
+
     config = init_config()
     if not config:
         return
@@ -161,113 +217,73 @@ def main():
     #print('Response dictionary: \n\r{}'.format(json.dumps(response_dict, indent=2)))
     #find_poi(api, position[0], position[1])
 def make_api(user, passwd):
-    api = PGoApi()
-
-    # provide player position on the earth
-    api.set_position(*default_position)
+    while True:
+        api = PGoApi()
+        api.set_concurrency_controller(concurrency, user)
+        api.set_endpoint_health(endpoint_health)
+        if get_exporter():
+            api.add_response_hook('GET_MAP_OBJECTS', get_exporter().add_response)
 
-    if not api.login('ptc', user, passwd):
-        return
-    return api
+        # provide player position on the earth
+        api.set_position(*default_position)
 
-def find_poi(api, lat, lng, pokeOnly):
+        try:
+            if not api.login('ptc', user, passwd):
+                return
+        except CircuitOpenException as e:
+            print("%s can not log in: %s" % (user, e))
+            scanner.cooldown(user, e.retry_after, 'login_circuit_open')
+            continue
+
+        # handed out the same failing endpoint again, wait until it gets probed
+        retry_after = endpoint_health.retry_after(api.get_api_endpoint())
+        if retry_after:
+            print("%s waits %.0fs for %s" % (user, retry_after, api.get_api_endpoint()))
+            scanner.cooldown(user, retry_after, 'endpoint_unhealthy')
+        return api
+
+def find_poi(api, lat, lng, pokeOnly, on_items=None, deduper=None):
+    # on_items(items) receives the push items of every map cell as soon as it arrived,
+    # deduper (an EncounterDeduper) drops wild pokemon of earlier scans before they are converted
     poi = {'pokemons': {}, 'forts': {}}
     step_size = 0.0010
     step_limit = 1
     if pokeOnly:
         step_limit = 49
     coords = generate_spiral(lat, lng, step_size, step_limit)
-    for coord in coords:
-        time.sleep(0.3)
-        lat = coord['lat']
-        lng = coord['lng']
-        api.set_position(lat, lng, 0)
-
-        cellid = get_cellid(lat, lng)
-        print("Getting %s %s"% (lat, lng))
-        timestamp = [0,] * len(cellid)
-
-        api.get_map_objects(latitude=f2i(lat), longitude=f2i(lng), since_timestamp_ms=timestamp, cell_id=cellid)
-
-        response_dict = api.call()
-        if response_dict['responses']['GET_MAP_OBJECTS']['status'] == 1:
-            for map_cell in response_dict['responses']['GET_MAP_OBJECTS']['map_cells']:
-                if 'forts' in map_cell:
-                    for fort in map_cell['forts']:
-                        poi["forts"][fort["id"]] = fort
-                if 'wild_pokemons' in map_cell:
-                    for pokemon in map_cell['wild_pokemons']:
-                        poi['pokemons'][pokemon["encounter_id"]] = pokemon
-
-        # time.sleep(0.51)
-    bulk=[]
-    for fortid in poi["forts"]:
-        fort = poi["forts"][fortid]
-        props = {
-            "id": fort["id"],
-            "LastModifiedMs": fort["last_modified_timestamp_ms"]
-            }
-
-        p = {"type": "Point", "coordinates": [fort["longitude"],fort["latitude"]]}
-        if "type" in fort:
-          props["marker-symbol"] = "circle"
-          props["title"] = "PokeStop"
-          props["type"] = "pokestop"
-          props["lure"] = "lure_info" in fort
-        else:
-          props["marker-symbol"] = "town-hall"
-          props["marker-size"] = "large"
-          props["type"] = "gym"
-
-        if "owned_by_team" in fort:
-           if fort["owned_by_team"] == BLUE:
-             props["marker-color"] = "0000FF"
-             props["title"] = "Blue Gym"
-           elif fort["owned_by_team"] == RED:
-             props["marker-color"] = "FF0000"
-             props["title"] = "Red Gym"
-           elif fort["owned_by_team"] == YELLOW:
-             props["marker-color"] = "FF0000"
-             props["title"] = "Yellow Gym"
-        else:
-            if "lure_info" in fort:
-                print("This should have lure info")
-                print(fort)
-                props["lure"] = True
-                props["lure_info"] = fort["lure_info"]
-                t = createItem(props["type"], fort["id"], p, props)
-                print(t)
-            props["marker-color"] = "808080"
-        if pokeOnly == False:
-            bulk.append(createItem(props["type"], fort["id"], p, props))
-            print("adding pokestop")
-    
+    points = [(coord['lat'], coord['lng']) for coord in coords]
+
     pokemonsJSON = json.load(
         open("pokenames.json"))
-    print("made big")
-    for encounter in poi["pokemons"]:
-        pokemon = poi["pokemons"][encounter]
-        pokeid = pokemon["pokemon_data"]["pokemon_id"]
-        pokename = pokemonsJSON[str(pokeid)]
-        f = {
-          "id": "wild%s" % pokemon["encounter_id"],
-          "type": "wild",
-          "pokemonNumber": pokeid,
-          "TimeTillHiddenMs": pokemon["time_till_hidden_ms"],
-          "WillDisappear": pokemon["time_till_hidden_ms"] + int(time.time()*1000),
-          "title": "Wild %s" %pokename,
-          "marker-color": "FF0000"
-          }
-        p = {"type": "Point", "coordinates": [pokemon["longitude"], pokemon["latitude"]]}
-
+    bulk=[]
+    # only cells which are not fresh in the shared cache are requested
+    for map_cell in api.scan(points, cache=cell_cache, tracker=map_tracker,
+                             fetched_callback=archive.record if archive else None):
+        items = []
+        for fort in map_cell.get('forts', []):
+            poi["forts"][fort["id"]] = fort
+            if pokeOnly == False:
+                items.append(Fort.from_dict(fort).to_push_item())
+        pokemons = map_cell.get('wild_pokemons', [])
+        for pokemon in pokemons:
+            poi['pokemons'][pokemon["encounter_id"]] = pokemon
         if pokeOnly:
-            bulk.append(createItem("pokemon", pokemon["encounter_id"], p, f))
+            for pokemon in (deduper.filter(pokemons) if deduper else pokemons):
+                items.append(WildPokemon.from_dict(pokemon, map_cell.get("current_timestamp_ms")).to_push_item(pokemonsJSON))
+        bulk += items
+        if on_items and items:
+            on_items(items)
+
     print('POI dictionary: \n\r{}'.format(json.dumps(bulk, indent=2)))
-    print(time.time())
-    dumpToMap(bulk)
-    print(time.time())
     print('Open this in a browser to see the path the spiral search took:')
     print_gmaps_dbug(coords)
+    return bulk, poi
+
+def index_poi(poi):
+    for fort in poi["forts"].values():
+        poi_index.add_fort(fort)
+    for pokemon in poi["pokemons"].values():
+        poi_index.add_pokemon(pokemon)
 
 def get_key_from_pokemon(pokemon):
     return '{}-{}'.format(pokemon['spawnpoint_id'], pokemon['pokemon_data']['pokemon_id'])
@@ -278,96 +294,175 @@ def print_gmaps_dbug(coords):
         url_string += '{},{}|'.format(coord['lat'], coord['lng'])
     print(url_string[:-1])
 
-def generate_spiral(starting_lat, starting_lng, step_size, step_limit):
-    coords = [{'lat': starting_lat, 'lng': starting_lng}]
-    steps,x,y,d,m = 1, 0, 0, 1, 1
-    rlow = 0.0
-    rhigh = 0.0005
-
-    while steps < step_limit:
-        while 2 * x * d < m and steps < step_limit:
-            x = x + d
-            steps += 1
-            lat = x * step_size + starting_lat + random.uniform(rlow, rhigh)
-            lng = y * step_size + starting_lng + random.uniform(rlow, rhigh)
-            coords.append({'lat': lat, 'lng': lng})
-#DOUBLE IT UP
-            coords.append({'lat': lat, 'lng': lng})
-        while 2 * y * d < m and steps < step_limit:
-            y = y + d
-            steps += 1
-            lat = x * step_size + starting_lat + random.uniform(rlow, rhigh)
-            lng = y * step_size + starting_lng + random.uniform(rlow, rhigh)
-            coords.append({'lat': lat, 'lng': lng})
-#DOUBLE IT UP
-            coords.append({'lat': lat, 'lng': lng})
-
-        d = -1 * d
-        m = m + 1
-    return coords
-
 def createItem(dataType, uid, location, properties=None):
     item = {"type":dataType, "uid":uid,"location":location,"properties":properties}
     return item
 
 def dumpToMap(data):
-    if bearer == "":
+    if pusher is None:
         return
     if len(data) == 0:
         return
-    headers = {"Authorization" : "Bearer %s" % bearer}
-    r = requests.post("%s/api/push/mapobject/bulk" % endpoint, json = data, headers = headers)
-    print("Successfully sent!")
+    # only new or changed objects are queued, the pusher posts them in batches
+    pusher.submit(data)
+
+def busy(retry_after):
+    return json.dumps({"error": "busy", "retry_after": retry_after}), 429, {"Retry-After": "%s" % retry_after}
 
 @app.route("/")
 def retQueue():
   size = q.qsize()
   return "%s" % size
 
-prevreq = []
+@app.route("/metrics")
+def metricsPage():
+  return metrics.exposition(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+@app.route("/cacheStats")
+def cacheStats():
+  return json.dumps(cell_cache.stats())
+
+@app.route("/pushStats")
+def pushStats():
+  return json.dumps(pusher.stats() if pusher else {})
+
+@app.route('/nearby/<lat>/<lon>')
+@app.route('/nearby/<lat>/<lon>/<radius>')
+def nearby(lat,lon,radius=200):
+    lat, lon, radius = float(lat), float(lon), float(radius)
+    return json.dumps({
+        "pokemons": poi_index.query_radius(lat, lon, radius, kind="pokemon"),
+        "forts": poi_index.query_radius(lat, lon, radius, kind="fort"),
+        })
+
+@app.route("/archiveStats")
+def archiveStats():
+  return json.dumps(archive.stats() if archive else {})
+
+@app.route("/admissionStats")
+def admissionStats():
+  return json.dumps(admission.stats())
+
+@app.route("/dedupeStats")
+def dedupeStats():
+  return json.dumps(encounters.stats())
+
+@app.route("/concurrencyStats")
+def concurrencyStats():
+  return json.dumps(concurrency.stats())
+
+@app.route("/circuitStats")
+def circuitStats():
+  return json.dumps(endpoint_health.stats())
+
+@app.route("/schedulerStats")
+def schedulerStats():
+  return json.dumps(q.stats())
+
 @app.route('/addPokemon/<lat>/<lon>')
 def addPokemon(lat,lon):
-    global prevreq
-    if (lat,lon) in prevreq:
-        print("They suck")
-        return "You suck"
     if abs(float(lon)) > 180:
         return "Too big!"
-    if len(prevreq) >=20:
-        prevreq.pop()
-    prevreq.append((lat,lon))
+    admitted, retry_after = admission.admit(request.remote_addr)
+    if not admitted:
+        return busy(retry_after)
     #for nlat, nlon in get_surrounding(float(lat),float(lon)):
-    q.put(((float(lat),float(lon)), True))
+    q.put(float(lat), float(lon), priority=1, kind=True)
     return "Queue is %s"% q.qsize()
 
 @app.route('/addToQueue/<lat>/<lon>')
 def addToQueue(lat,lon):
-    global prevreq
-    if (lat,lon) in prevreq:
-        print("They suck")
-        return "You suck"
     if abs(float(lon)) > 180:
         return "Too big!"
-    if len(prevreq) >=20:
-        prevreq.pop()
-    prevreq.append((lat,lon))
-    q.put(((float(lat),float(lon)), False))
+    admitted, retry_after = admission.admit(request.remote_addr)
+    if not admitted:
+        return busy(retry_after)
+    q.put(float(lat), float(lon), kind=False)
     return "Queue is %s"% q.qsize()
 
 def worker(user, passwd):
     api = make_api(user, passwd)
     print("%s logged in" % user)
+    dispatcher.register(user, default_position[0], default_position[1])
     while True:
-        position, pokeOnly = q.get()
+        job = dispatcher.get(user)
+        start = time.time()
         try:
-            find_poi(api, position[0], position[1], pokeOnly)
+            # pushed cell by cell while the spiral is still running
+            bulk, poi = find_poi(api, job.lat, job.lng, job.kind, on_items=dumpToMap, deduper=encounters)
+            index_poi(poi)
+            q.task_done(job)
+            admission.completed()
+            scanner.scans.labels(user, 'success').inc()
+            scanner.scan_duration.observe(time.time() - start)
+        except CircuitOpenException as e:
+            # the endpoint of this login is failing, a new login may get a healthy one
+            print(e)
+            scanner.scans.labels(user, 'circuit_open').inc()
+            scanner.relogins.labels(user).inc()
+            q.retry(job)
+            api = make_api(user, passwd)
         except Exception as e:
             print(e)
+            scanner.scans.labels(user, 'error').inc()
+            scanner.relogins.labels(user).inc()
             api = make_api(user, passwd)
-            q.put((position, pokeOnly))
+            q.retry(job)
+
+def shard_worker(user):
+    # runs inside a scan process, the parsed results are pushed by the front-end
+    state = {"api": make_api(user, password)}
+    print("%s logged in" % user)
+    def scan(lat, lng, pokeOnly):
+        try:
+            return find_poi(state["api"], lat, lng, pokeOnly)
+        except Exception:
+            state["api"] = make_api(user, password)
+            raise
+    return scan
+
+def dispatch(supervisor):
+    while True:
+        supervisor.submit(q.get())
+
+def collect(supervisor):
+    while True:
+        finished = supervisor.get_result()
+        if finished is None:
+            continue
+        job, result, error = finished
+        # the accounts live in the scan processes, results are counted per shard
+        shard = "shard%s" % supervisor.get_shard(job.lat, job.lng)
+        if error is not None:
+            print(error)
+            scanner.scans.labels(shard, 'error').inc()
+            q.retry(job)
+            continue
+        bulk, poi = result
+        index_poi(poi)
+        # deduped here and not in the scan process, a failed push has to be able to forget the encounters
+        dumpToMap([item for item in bulk if item["type"] != "pokemon" or not encounters.seen(item["uid"])])
+        q.task_done(job)
+        admission.completed()
+        scanner.scans.labels(shard, 'success').inc()
+        scanner.scan_duration.observe(time.time() - job.submitted)
+
 if __name__ == '__main__':
-    for acct in useraccs:
-        t = threading.Thread(target=worker, args=(acct,password))
-        t.daemon = True
-        t.start()
+    if worker_processes:
+        # the scan processes are spawned, they import this module again without running __main__
+        supervisor = ShardSupervisor(worker_processes, useraccs, shard_worker)
+        supervisor.start()
+        for target in (dispatch, collect):
+            t = threading.Thread(target=target, args=(supervisor,))
+            t.daemon = True
+            t.start()
+    else:
+        # every thread logs in on its own, the account limiter decides how many of them scan at once
+        for acct in useraccs:
+            for i in range(threads_per_account):
+                t = threading.Thread(target=worker, args=(acct,password))
+                t.daemon = True
+                t.start()
+    if pusher:
+        pusher.start()
     app.run(host="0.0.0.0", port=5000)
@@ -1,14 +1,16 @@
 
 from __future__ import absolute_import
 
-from pgoapi.exceptions import PleaseInstallProtobufVersion3
+from time import time as _now
 
-import pkg_resources
+from pgoapi.exceptions import PleaseInstallProtobufVersion3
 
+_check_started = _now()
 protobuf_exist = False
 protobuf_version = 0
 try:
-    protobuf_version = pkg_resources.get_distribution("protobuf").version
+    # the package version is much cheaper than asking pkg_resources
+    from google.protobuf import __version__ as protobuf_version
     protobuf_exist = True
 except:
     pass
@@ -16,6 +18,13 @@ except:
 if (not protobuf_exist) or (int(protobuf_version[:1]) < 3):
     raise PleaseInstallProtobufVersion3()
 
+# raises SlowProtobufBackendException on the pure python backend if PGOAPI_STRICT_PROTOBUF is set
+from pgoapi.protobuf_backend import check_backend, get_backend
+# not named protobuf_backend, that would hide the pgoapi.protobuf_backend module
+PROTOBUF_BACKEND = check_backend()
+# seconds of the protobuf version and backend checks above, reported by pokecli --profile-startup
+PROTOBUF_CHECK_SECONDS = _now() - _check_started
+
 from pgoapi.pgoapi import PGoApi
 from pgoapi.rpc_api import RpcApi
 from pgoapi.auth import Auth
@@ -0,0 +1,184 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import math
+import time
+import logging
+import threading
+
+from collections import OrderedDict
+
+# coverage levels handed to the endpoints, see AdmissionController.coverage()
+FULL = 2
+REDUCED = 1
+MINIMAL = 0
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst, now=None):
+        # tokens added per second and the most tokens the bucket holds
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = now or time.time()
+
+    def take(self, tokens=1, now=None):
+        """ takes the tokens and returns 0, or returns the seconds until they would be available """
+        now = now or time.time()
+        self.tokens = min(self.burst, self.tokens + max(0, now - self.updated) * self.rate)
+        self.updated = now
+        if tokens > self.burst:
+            tokens = self.burst
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+
+class AdmissionController(object):
+
+    def __init__(self, scheduler, high_water=1000, rate=0.5, burst=20, degrade_at=(0.5, 0.8),
+                 smoothing=0.2, max_clients=10000, default_retry=30, max_retry=600):
+        self.log = logging.getLogger(__name__)
+
+        self._scheduler = scheduler
+        # queued jobs from which new work is refused
+        self._high_water = high_water
+        # per client quota, <rate> jobs per second with bursts up to <burst> jobs
+        self._rate = rate
+        self._burst = burst
+        # fractions of the high water mark from which coverage is reduced / minimal
+        self._degrade_at = degrade_at
+        # weight of the newest sample of the drain rate
+        self._smoothing = smoothing
+        self._max_clients = max_clients
+        # Retry-After while the drain rate is unknown, and its upper bound
+        self._default_retry = default_retry
+        self._max_retry = max_retry
+
+        self._lock = threading.Lock()
+        # client -> TokenBucket, least recently seen first
+        self._buckets = OrderedDict()
+
+        # jobs finished per second, exponentially weighted
+        self._drain_rate = None
+        self._window_start = time.time()
+        self._window_done = 0
+
+        self._admitted = 0
+        self._throttled = 0
+        self._saturated = 0
+
+    def admit(self, client, cost=1):
+        """ returns (True, 0) if the client may queue <cost> jobs, otherwise (False, seconds to retry after) """
+        now = time.time()
+        with self._lock:
+            excess = self._scheduler.qsize() + cost - self._high_water
+            if excess > 0:
+                self._saturated += 1
+                return False, self._retry_after(excess, now)
+
+            bucket = self._buckets.pop(client, None)
+            if bucket is None:
+                bucket = TokenBucket(self._rate, self._burst, now)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self._max_clients:
+                self._buckets.popitem(last=False)
+
+            wait = bucket.take(cost, now)
+            if wait:
+                self._throttled += 1
+                return False, self._clamp(wait)
+
+            self._admitted += 1
+            return True, 0
+
+    def retry_after(self, jobs=1):
+        """ seconds until the queue has drained enough to take <jobs> more jobs """
+        with self._lock:
+            excess = self._scheduler.qsize() + jobs - self._high_water
+            return self._retry_after(max(excess, jobs), time.time())
+
+    def completed(self, jobs=1):
+        # called for every finished job, feeds the drain rate
+        with self._lock:
+            self._window_done += jobs
+            self._sample(time.time())
+
+    def load(self):
+        return float(self._scheduler.qsize()) / self._high_water
+
+    def coverage(self):
+        """ FULL, REDUCED or MINIMAL - how many scan points a request may still queue """
+        load = self.load()
+        if load >= self._degrade_at[1]:
+            return MINIMAL
+        if load >= self._degrade_at[0]:
+            return REDUCED
+        return FULL
+
+    def drain_rate(self):
+        with self._lock:
+            self._sample(time.time())
+            return self._drain_rate
+
+    def stats(self):
+        with self._lock:
+            self._sample(time.time())
+            return {
+                'queued': self._scheduler.qsize(),
+                'high_water': self._high_water,
+                'drain_rate': self._drain_rate,
+                'clients': len(self._buckets),
+                'admitted': self._admitted,
+                'throttled': self._throttled,
+                'saturated': self._saturated,
+            }
+
+    def _sample(self, now):
+        # closes the current window after a second, an idle queue lowers the rate as well
+        elapsed = now - self._window_start
+        if elapsed < 1.0:
+            return
+        rate = self._window_done / elapsed
+        if self._drain_rate is None:
+            if self._window_done:
+                self._drain_rate = rate
+        else:
+            self._drain_rate += self._smoothing * (rate - self._drain_rate)
+        self._window_start = now
+        self._window_done = 0
+
+    def _retry_after(self, excess, now):
+        self._sample(now)
+        if not self._drain_rate:
+            return self._default_retry
+        return self._clamp(excess / self._drain_rate)
+
+    def _clamp(self, seconds):
+        return min(self._max_retry, max(1, int(math.ceil(seconds))))
@@ -0,0 +1,102 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+# asyncio front of PGoApi (Python 3 only). The RPCs itself stay blocking
+# requests calls, they run in an executor so the event loop never waits on them.
+
+from __future__ import absolute_import
+
+import asyncio
+import logging
+
+from pgoapi.pgoapi import PGoApi
+from pgoapi.utilities import f2i, get_cell_ids
+from pgoapi.map_scan import MapRequest, scan_steps
+
+
+class AsyncPGoApi(object):
+
+    def __init__(self, api=None, executor=None):
+        self.log = logging.getLogger(__name__)
+
+        self._api = api or PGoApi()
+        self._executor = executor
+        # PGoApi collects the sub requests on the instance, one RPC at a time
+        self._lock = asyncio.Lock()
+
+    @property
+    def api(self):
+        return self._api
+
+    async def login(self, provider, username, password, position=None):
+        async with self._lock:
+            if position is not None:
+                self._api.set_position(*position)
+            return await self._run(self._api.login, provider, username, password)
+
+    async def execute(self, *requests, **kwargs):
+        """ runs one RPC with the given (request name, arguments) tuples, e.g. ('get_player', {}) """
+        position = kwargs.get('position')
+        async with self._lock:
+            if position is not None:
+                self._api.set_position(*position)
+            for name, arguments in requests:
+                getattr(self._api, name)(**arguments)
+            return await self._run(self._api.call)
+
+    async def get_map_objects(self, lat, lng, cell_ids=None, since_timestamp_ms=None):
+        if cell_ids is None:
+            cell_ids = get_cell_ids(lat, lng)
+        if since_timestamp_ms is None:
+            since_timestamp_ms = [0] * len(cell_ids)
+
+        arguments = {
+            'latitude': f2i(lat),
+            'longitude': f2i(lng),
+            'since_timestamp_ms': since_timestamp_ms,
+            'cell_id': cell_ids,
+        }
+        return await self.execute(('get_map_objects', arguments), position=(lat, lng, 0))
+
+    async def scan(self, points, radius=10, pace=0.3, retries=2, project=None, cache=None, tracker=None, fetched_callback=None):
+        """ async iterator twin of PGoApi.scan """
+        steps = scan_steps(points, radius, pace, retries, project, cache, tracker, fetched_callback)
+        try:
+            step = next(steps)
+            while True:
+                if not isinstance(step, MapRequest):
+                    yield step
+                    step = next(steps)
+                    continue
+                if step.wait:
+                    await asyncio.sleep(step.wait)
+                response = await self.get_map_objects(step.lat, step.lng, step.cell_ids, step.since_timestamp_ms)
+                step = steps.send(response)
+        except StopIteration:
+            return
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
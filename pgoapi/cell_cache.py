@@ -0,0 +1,124 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from collections import OrderedDict
+
+
+class CellCache(object):
+
+    def __init__(self, ttl=30, max_cells=20000):
+        self.log = logging.getLogger(__name__)
+
+        self._ttl = ttl
+        self._max_cells = max_cells
+
+        self._lock = threading.Lock()
+        # s2 cell id -> (stored at, map cell), oldest access first
+        self._cells = OrderedDict()
+
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+
+    def get(self, cell_id):
+        with self._lock:
+            return self._get(cell_id, time.time())
+
+    def lookup(self, cell_ids):
+        """ splits cell_ids into the fresh cached cells ({cell id: map cell}) and a list of ids which have to be fetched """
+        fresh = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            for cell_id in cell_ids:
+                cell = self._get(cell_id, now)
+                if cell is None:
+                    missing.append(cell_id)
+                else:
+                    fresh[cell_id] = cell
+        return fresh, missing
+
+    def put(self, cell_id, cell):
+        with self._lock:
+            self._put(cell_id, cell, time.time())
+
+    def put_many(self, cells):
+        now = time.time()
+        with self._lock:
+            for cell in cells:
+                self._put(cell['s2_cell_id'], cell, now)
+
+    def invalidate(self, cell_ids):
+        with self._lock:
+            for cell_id in cell_ids:
+                self._cells.pop(cell_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._cells),
+                'hits': self._hits,
+                'misses': self._misses,
+                'expired': self._expired,
+                'evictions': self._evictions,
+                'hit_rate': float(self._hits) / lookups if lookups else 0.0,
+            }
+
+    def _get(self, cell_id, now):
+        entry = self._cells.pop(cell_id, None)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        stored_at, cell = entry
+        if now - stored_at > self._ttl:
+            self._expired += 1
+            self._misses += 1
+            return None
+
+        # re-insert to mark the cell as most recently used
+        self._cells[cell_id] = entry
+        self._hits += 1
+        return cell
+
+    def _put(self, cell_id, cell, now):
+        self._cells.pop(cell_id, None)
+        self._cells[cell_id] = (now, cell)
+
+        while len(self._cells) > self._max_cells:
+            self._cells.popitem(last=False)
+            self._evictions += 1
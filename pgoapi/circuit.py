@@ -0,0 +1,199 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from collections import deque
+
+from pgoapi.metrics import Counter, Gauge
+from pgoapi.concurrency import SUCCESS, BUSY, ERROR
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class Permit(object):
+    """ handed out by CircuitBreaker.allow() for every call which may go out, passed back to record() """
+    __slots__ = ('probe',)
+
+    def __init__(self, probe=False):
+        self.probe = probe
+
+
+# calls of a closed breaker are all alike, only probes need their own permit
+CALL = Permit()
+
+CIRCUIT_STATE = Gauge('pgoapi_circuit_state', 'State of the endpoint circuit breaker (0 closed, 1 half open, 2 open)', ['endpoint'])
+CIRCUIT_TRANSITIONS = Counter('pgoapi_circuit_transitions_total', 'State changes of the endpoint circuit breakers', ['endpoint', 'state'])
+CIRCUIT_REJECTED = Counter('pgoapi_circuit_rejected_total', 'RPCs not sent because the breaker of the endpoint was open', ['endpoint'])
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name='', failure_threshold=5, failure_rate=0.5, window=20, min_calls=10,
+                 reset_timeout=30.0, max_reset_timeout=300.0, half_open_probes=1):
+        self.log = logging.getLogger(__name__)
+
+        self.name = name
+        # trips after <failure_threshold> failures in a row, or when <failure_rate> of the last <window> calls failed
+        self._failure_threshold = failure_threshold
+        self._failure_rate = failure_rate
+        self._min_calls = min_calls
+        # seconds until an open breaker lets probes through, doubled by every failed probe
+        self._reset_timeout = reset_timeout
+        self._max_reset_timeout = max_reset_timeout
+        self._half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._timeout = reset_timeout
+        self._opened_at = None
+        # permits of the probes in flight, a call admitted before the breaker opened is not one of them
+        self._probes = set()
+
+        self._state_gauge = CIRCUIT_STATE.labels(name)
+        self._state_gauge.set(STATE_VALUES[CLOSED])
+
+    def allow(self):
+        """ a Permit if a call may go out, otherwise None - in half open state only the probes do """
+        with self._lock:
+            if self._state == OPEN:
+                if time.time() < self._opened_at + self._timeout:
+                    CIRCUIT_REJECTED.labels(self.name).inc()
+                    return None
+                self._transition(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                if len(self._probes) >= self._half_open_probes:
+                    CIRCUIT_REJECTED.labels(self.name).inc()
+                    return None
+                permit = Permit(probe=True)
+                self._probes.add(permit)
+                return permit
+            return CALL
+
+    def record(self, outcome, permit=CALL):
+        # SUCCESS, BUSY or ERROR of an allowed call, anything else only frees its probe slot
+        with self._lock:
+            # only a probe of the current half open period decides it, an older one merely counts
+            probe = permit in self._probes
+            if probe:
+                self._probes.discard(permit)
+
+            if outcome == SUCCESS:
+                self._consecutive_failures = 0
+                self._outcomes.append(True)
+                if probe:
+                    self._timeout = self._reset_timeout
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+            elif outcome in (BUSY, ERROR):
+                self._consecutive_failures += 1
+                self._outcomes.append(False)
+                if probe:
+                    self._timeout = min(self._max_reset_timeout, self._timeout * 2)
+                    self._open()
+                elif self._state == CLOSED and self._should_trip():
+                    self._open()
+
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def retry_after(self):
+        """ seconds until an open breaker lets the next probe through, 0 if calls are allowed """
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(0.0, self._opened_at + self._timeout - time.time())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'failures': self._outcomes.count(False),
+                'calls': len(self._outcomes),
+                'consecutive_failures': self._consecutive_failures,
+                'reset_timeout': self._timeout,
+            }
+
+    def _should_trip(self):
+        if self._consecutive_failures >= self._failure_threshold:
+            return True
+        if len(self._outcomes) < self._min_calls:
+            return False
+        return float(self._outcomes.count(False)) / len(self._outcomes) >= self._failure_rate
+
+    def _open(self):
+        self._opened_at = time.time()
+        self._probes.clear()
+        self._transition(OPEN)
+        self.log.warning('Circuit of %s opened, next probe in %.0fs', self.name, self._timeout)
+
+    def _transition(self, state):
+        if state == self._state:
+            return
+        self._state = state
+        self._state_gauge.set(STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+
+
+class EndpointHealth(object):
+    """ one CircuitBreaker per api_url, shared by all PGoApi instances of a process """
+
+    def __init__(self, **options):
+        self._options = options
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def breaker(self, endpoint):
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(endpoint, **self._options)
+            return breaker
+
+    def allow(self, endpoint):
+        return self.breaker(endpoint).allow()
+
+    def record(self, endpoint, outcome, permit=CALL):
+        self.breaker(endpoint).record(outcome, permit)
+
+    def retry_after(self, endpoint):
+        return self.breaker(endpoint).retry_after()
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return dict((endpoint, breaker.stats()) for endpoint, breaker in breakers)
@@ -0,0 +1,206 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import os
+import re
+import glob
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+SIGHTING_FIELDS = [
+    ('encounter_id', 'u8'),
+    ('pokemon_id', 'u2'),
+    ('latitude', 'f8'),
+    ('longitude', 'f8'),
+    # spawnpoint ids are hex encoded s2 cell tokens
+    ('spawnpoint_id', 'u8'),
+    ('cell_id', 'u8'),
+    ('seen_ms', 'i8'),
+    ('disappear_ms', 'i8'),
+]
+
+FORT_FIELDS = [
+    ('id', 'S40'),
+    ('cell_id', 'u8'),
+    ('latitude', 'f8'),
+    ('longitude', 'f8'),
+    ('type', 'u1'),
+    ('team', 'u1'),
+    ('last_modified_ms', 'i8'),
+    ('guard_pokemon_id', 'u2'),
+    ('gym_points', 'i8'),
+    ('lure_expires_ms', 'i8'),
+]
+
+# <table>-[<writer>-]<chunk>.npy
+CHUNK_PATTERN = re.compile(r'^([a-z]+)-(?:(\w+)-)?(\d+)\.npy$')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('numpy is required for the columnar export - pip install numpy')
+
+
+def sighting_dtype():
+    _require_numpy()
+    return np.dtype(SIGHTING_FIELDS)
+
+
+def fort_dtype():
+    _require_numpy()
+    return np.dtype(FORT_FIELDS)
+
+
+def _spawnpoint_to_int(spawnpoint_id):
+    try:
+        return int(spawnpoint_id, 16) if spawnpoint_id else 0
+    except ValueError:
+        return 0
+
+
+def map_objects_to_arrays(response):
+    """ converts a GetMapObjectsResponse message into (sightings, forts) structured arrays """
+    _require_numpy()
+
+    sightings = []
+    forts = []
+    for cell in response.map_cells:
+        cell_id = cell.s2_cell_id
+        now_ms = cell.current_timestamp_ms
+        for pokemon in cell.wild_pokemons:
+            sightings.append((
+                pokemon.encounter_id,
+                pokemon.pokemon_data.pokemon_id,
+                pokemon.latitude,
+                pokemon.longitude,
+                _spawnpoint_to_int(pokemon.spawnpoint_id),
+                cell_id,
+                now_ms,
+                now_ms + pokemon.time_till_hidden_ms,
+            ))
+        for fort in cell.forts:
+            forts.append((
+                fort.id.encode('ascii', 'replace'),
+                cell_id,
+                fort.latitude,
+                fort.longitude,
+                fort.type,
+                fort.owned_by_team,
+                fort.last_modified_timestamp_ms,
+                fort.guard_pokemon_id,
+                fort.gym_points,
+                fort.lure_info.lure_expires_timestamp_ms,
+            ))
+
+    return np.array(sightings, dtype=sighting_dtype()), np.array(forts, dtype=fort_dtype())
+
+
+def load_chunks(directory, table='sightings', mmap=True, concatenate=True):
+    """ loads all chunks of a table, memory mapped unless mmap=False """
+    _require_numpy()
+
+    paths = sorted(glob.glob(os.path.join(directory, '{}-*.npy'.format(table))))
+    chunks = [np.load(path, mmap_mode='r' if mmap else None) for path in paths]
+    if not concatenate:
+        return chunks
+    if not chunks:
+        return np.empty(0, dtype=sighting_dtype() if table == 'sightings' else fort_dtype())
+    return np.concatenate(chunks)
+
+
+class ColumnarExporter(object):
+
+    def __init__(self, directory, chunk_rows=100000, writer=None):
+        _require_numpy()
+
+        self.log = logging.getLogger(__name__)
+
+        self._directory = directory
+        self._chunk_rows = chunk_rows
+        # part of the file names, processes exporting into the same directory need distinct ones
+        self._writer = writer
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._buffers = {'sightings': [], 'forts': []}
+        self._rows = {'sightings': 0, 'forts': 0}
+        self._next_chunk = self._find_next_chunk()
+
+    def add_response(self, response):
+        # usable as PGoApi response hook for GET_MAP_OBJECTS
+        sightings, forts = map_objects_to_arrays(response)
+        self.append(sightings, forts)
+
+    def append(self, sightings, forts):
+        with self._lock:
+            for table, array in (('sightings', sightings), ('forts', forts)):
+                if len(array):
+                    self._buffers[table].append(array)
+                    self._rows[table] += len(array)
+                if self._rows[table] >= self._chunk_rows:
+                    self._write(table)
+
+    def flush(self):
+        with self._lock:
+            for table in self._buffers:
+                if self._rows[table]:
+                    self._write(table)
+
+    def _write(self, table):
+        array = np.concatenate(self._buffers[table])
+        if self._writer is None:
+            name = '{}-{:06d}.npy'.format(table, self._next_chunk[table])
+        else:
+            name = '{}-{}-{:06d}.npy'.format(table, self._writer, self._next_chunk[table])
+        path = os.path.join(self._directory, name)
+
+        # chunks are never modified once written, readers only see complete files
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.rename(tmp_path, path)
+
+        self._next_chunk[table] += 1
+        self._buffers[table] = []
+        self._rows[table] = 0
+        self.log.debug('Wrote %s rows to %s', len(array), path)
+
+    def _find_next_chunk(self):
+        next_chunk = {'sightings': 0, 'forts': 0}
+        for name in os.listdir(self._directory):
+            match = CHUNK_PATTERN.match(name)
+            if match and match.group(1) in next_chunk and match.group(2) == self._writer:
+                next_chunk[match.group(1)] = max(next_chunk[match.group(1)], int(match.group(3)) + 1)
+        return next_chunk
@@ -0,0 +1,185 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from pgoapi.metrics import Gauge
+
+CONCURRENCY_LIMIT = Gauge('pgoapi_concurrency_limit', 'Current AIMD limit of in flight RPCs', ['scope', 'key'])
+IN_FLIGHT = Gauge('pgoapi_rpc_in_flight', 'RPCs currently in flight', ['scope', 'key'])
+
+# outcomes of an RPC passed to release()
+SUCCESS = 'success'
+BUSY = 'busy'
+ERROR = 'error'
+# neither a congestion signal nor a success, e.g. not logged in
+IGNORE = 'ignore'
+
+
+class AimdLimiter(object):
+    """ limit of concurrent RPCs, raised by one per limit successes and halved on congestion """
+
+    def __init__(self, initial=1, minimum=1, maximum=8, decrease=0.5, latency_factor=2.0, smoothing=0.1,
+                 scope='endpoint', key=''):
+        self.log = logging.getLogger(__name__)
+
+        self._minimum = minimum
+        self._maximum = maximum
+        self._decrease = decrease
+        # a latency above <latency_factor> times the baseline counts as congestion
+        self._latency_factor = latency_factor
+        self._smoothing = smoothing
+
+        self._cond = threading.Condition(threading.Lock())
+        self._limit = float(initial)
+        self._in_flight = 0
+        # smoothed latency of uncongested RPCs
+        self._baseline = None
+        self._last_decrease = 0.0
+
+        self._successes = 0
+        self._congestions = 0
+
+        self._limit_gauge = CONCURRENCY_LIMIT.labels(scope, key)
+        self._in_flight_gauge = IN_FLIGHT.labels(scope, key)
+        self._limit_gauge.set(self._limit)
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            self._in_flight += 1
+            self._in_flight_gauge.set(self._in_flight)
+            return True
+
+    def release(self, outcome=SUCCESS, latency=None):
+        with self._cond:
+            # a limit which was not reached says nothing about a higher one
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            self._in_flight_gauge.set(self._in_flight)
+
+            if outcome == SUCCESS and latency is not None and self._inflated(latency):
+                outcome = BUSY
+            if outcome == SUCCESS:
+                self._successes += 1
+                # additive increase: one more slot after <limit> successful RPCs
+                if saturated:
+                    self._limit = min(self._maximum, self._limit + 1.0 / self._limit)
+                if latency is not None:
+                    self._baseline = latency if self._baseline is None else self._baseline + self._smoothing * (latency - self._baseline)
+            elif outcome in (BUSY, ERROR):
+                self._congestions += 1
+                self._back_off(latency)
+
+            self._limit_gauge.set(self._limit)
+            self._cond.notify_all()
+
+    def limit(self):
+        with self._cond:
+            return int(self._limit)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': self._limit,
+                'in_flight': self._in_flight,
+                'baseline_latency': self._baseline,
+                'successes': self._successes,
+                'congestions': self._congestions,
+            }
+
+    def _inflated(self, latency):
+        return self._baseline is not None and latency > self._baseline * self._latency_factor
+
+    def _back_off(self, latency):
+        # RPCs which were in flight together report the same congestion, only react once per round trip
+        now = time.time()
+        if now - self._last_decrease < (latency or self._baseline or 1.0):
+            return
+        self._last_decrease = now
+        old = self._limit
+        self._limit = max(self._minimum, self._limit * self._decrease)
+        if int(old) != int(self._limit):
+            self.log.debug('Lowered concurrency limit from %s to %s', int(old), int(self._limit))
+
+
+class ConcurrencyController(object):
+    """ one AimdLimiter per API endpoint and one per account, an RPC needs a slot of both """
+
+    def __init__(self, endpoint_limits=(2, 1, 32), account_limits=(1, 1, 4), **options):
+        # (initial, minimum, maximum) of the limiters
+        self._endpoint_limits = endpoint_limits
+        self._account_limits = account_limits
+        self._options = options
+
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    def limiter(self, scope, key):
+        with self._lock:
+            limiter = self._limiters.get((scope, key))
+            if limiter is None:
+                initial, minimum, maximum = self._endpoint_limits if scope == 'endpoint' else self._account_limits
+                limiter = AimdLimiter(initial, minimum, maximum, scope=scope, key=key, **self._options)
+                self._limiters[(scope, key)] = limiter
+            return limiter
+
+    def acquire(self, endpoint, account=None, timeout=None):
+        """ returns the limiters to pass to release(), or None if no slot was free within timeout """
+        # always the account first, nobody holds an endpoint slot while waiting for an account
+        limiters = []
+        if account is not None:
+            limiters.append(self.limiter('account', account))
+        limiters.append(self.limiter('endpoint', endpoint))
+
+        acquired = []
+        for limiter in limiters:
+            if not limiter.acquire(timeout):
+                for held in acquired:
+                    held.release(IGNORE)
+                return None
+            acquired.append(limiter)
+        return acquired
+
+    def release(self, limiters, outcome=SUCCESS, latency=None):
+        for limiter in limiters:
+            limiter.release(outcome, latency)
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.items())
+        return dict(('{}:{}'.format(scope, key), limiter.stats()) for (scope, key), limiter in limiters)
@@ -0,0 +1,92 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+
+class EncounterDeduper(object):
+    """ remembers encounter ids for at least <window> seconds, in two rotating generations """
+
+    def __init__(self, window=1800, max_entries=500000):
+        self.log = logging.getLogger(__name__)
+
+        # a wild pokemon is visible at most 15 minutes, ids older than that cannot come back
+        self._window = window
+        # upper bound of remembered ids, reaching it rotates early and shortens the window
+        self._max_generation = max(1, max_entries // 2)
+
+        self._lock = threading.Lock()
+        self._current = set()
+        self._previous = set()
+        self._rotated = time.time()
+
+        self._checked = 0
+        self._duplicates = 0
+        self._early_rotations = 0
+
+    def seen(self, encounter_id):
+        """ returns True if the id was seen within the window, otherwise remembers it and returns False """
+        with self._lock:
+            self._rotate(time.time())
+            self._checked += 1
+            if encounter_id in self._current or encounter_id in self._previous:
+                self._duplicates += 1
+                return True
+            self._current.add(encounter_id)
+            return False
+
+    def forget(self, encounter_ids):
+        """ drops the ids again, e.g. of pokemon whose push failed, so that the next scan passes them """
+        with self._lock:
+            for encounter_id in encounter_ids:
+                self._current.discard(encounter_id)
+                self._previous.discard(encounter_id)
+
+    def filter(self, items, key=lambda item: item['encounter_id']):
+        # the items whose encounter was not seen before, in order
+        return [item for item in items if not self.seen(key(item))]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'remembered': len(self._current) + len(self._previous),
+                'checked': self._checked,
+                'duplicates': self._duplicates,
+                'early_rotations': self._early_rotations,
+            }
+
+    def _rotate(self, now):
+        if now - self._rotated >= self._window:
+            self._previous, self._current = self._current, set()
+            self._rotated = now
+        elif len(self._current) >= self._max_generation:
+            self._early_rotations += 1
+            self.log.debug('Encounter dedupe full after %.0fs, rotating early', now - self._rotated)
+            self._previous, self._current = self._current, set()
+            self._rotated = now
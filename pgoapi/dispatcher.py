@@ -0,0 +1,224 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import math
+import time
+import logging
+import threading
+
+from six.moves.queue import Empty
+
+from pgoapi.poi_index import distance
+
+
+class AccountDispatcher(object):
+
+    def __init__(self, scheduler, backlog=3, grid_size=0.01):
+        self.log = logging.getLogger(__name__)
+
+        self._scheduler = scheduler
+        # jobs an account may hold, more would take them away from closer accounts becoming idle
+        self._backlog_size = backlog
+        # edge length in degrees of the grid indexing idle accounts
+        self._grid_size = grid_size
+
+        self._cond = threading.Condition(threading.Lock())
+        # account -> (lat, lng) of its last scan
+        self._positions = {}
+        # account -> jobs ordered as walking path
+        self._backlogs = {}
+        # grid bucket -> set of accounts which can take more jobs
+        self._grid = {}
+        # account -> (bucket, (lat, lng)) it is indexed with
+        self._indexed = {}
+
+        self._thread = None
+
+    def register(self, account, lat, lng):
+        with self._cond:
+            self._positions[account] = (lat, lng)
+            self._backlogs.setdefault(account, [])
+            self._update_index(account)
+
+    def get(self, account, timeout=None):
+        """ returns the next job of the account's walking path, blocks until one is assigned """
+        self._ensure_started()
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            if account not in self._positions:
+                raise KeyError('Account {} is not registered'.format(account))
+
+            while not self._backlogs.get(account):
+                if account not in self._positions:
+                    raise KeyError('Account {} was unregistered'.format(account))
+                self._update_index(account)
+                self._cond.notify_all()
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise Empty
+                    self._cond.wait(remaining)
+
+            job = self._backlogs[account].pop(0)
+            self._positions[account] = (job.lat, job.lng)
+            self._update_index(account)
+            return job
+
+    def unregister(self, account):
+        """ hands the jobs assigned to the account back to the scheduler, e.g. when its worker died """
+        with self._cond:
+            if account not in self._positions:
+                return 0
+            self._unindex(account)
+            del self._positions[account]
+            backlog = self._backlogs.pop(account)
+            self._cond.notify_all()
+
+        for job in backlog:
+            self._scheduler.retry(job)
+        if backlog:
+            self.log.info('Handed %s jobs of %s back to the scheduler', len(backlog), account)
+        return len(backlog)
+
+    def task_done(self, job):
+        self._scheduler.task_done(job)
+
+    def retry(self, job):
+        self._scheduler.retry(job)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'accounts': len(self._positions),
+                'available': len(self._indexed),
+                'assigned': sum(len(backlog) for backlog in self._backlogs.values()),
+            }
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            # only pull from the scheduler when an account can take the job
+            with self._cond:
+                while not self._indexed:
+                    self._cond.wait()
+
+            try:
+                job = self._scheduler.get(timeout=1.0)
+            except Empty:
+                continue
+
+            with self._cond:
+                self._assign(job)
+                self._cond.notify_all()
+
+    def _assign(self, job):
+        account = self._nearest(job.lat, job.lng)
+        if account is None:
+            # all accounts reached their backlog limit meanwhile, the job waits in the scheduler
+            self._scheduler.retry(job)
+            return
+
+        backlog = self._backlogs[account]
+        backlog.append(job)
+        self._backlogs[account] = self._walking_path(self._positions[account], backlog)
+        self._update_index(account)
+        self.log.debug('Assigned %s to %s (backlog %s)', job, account, len(backlog))
+
+    def _walking_path(self, start, jobs):
+        # nearest neighbour ordering starting at the account position
+        path = []
+        remaining = list(jobs)
+        lat, lng = start
+        while remaining:
+            nearest = min(remaining, key=lambda job: distance(lat, lng, job.lat, job.lng))
+            remaining.remove(nearest)
+            path.append(nearest)
+            lat, lng = nearest.lat, nearest.lng
+        return path
+
+    def _nearest(self, lat, lng):
+        # search the grid in growing rings around the job until the best account is certain
+        if not self._indexed:
+            return None
+
+        bx, by = self._bucket(lat, lng)
+        max_ring = max(max(abs(x - bx), abs(y - by)) for x, y in self._grid)
+
+        # accounts spread far apart, comparing all of them is cheaper than walking the rings
+        if (2 * max_ring + 1) ** 2 > 4 * len(self._grid):
+            return min(self._indexed, key=lambda account: distance(lat, lng, *self._indexed[account][1]))
+
+        best = None
+        best_distance = None
+        ring = 0
+        while ring <= max_ring:
+            for x in range(bx - ring, bx + ring + 1):
+                for y in range(by - ring, by + ring + 1):
+                    if max(abs(x - bx), abs(y - by)) != ring:
+                        continue
+                    for account in self._grid.get((x, y), ()):
+                        d = distance(lat, lng, *self._indexed[account][1])
+                        if best is None or d < best_distance:
+                            best, best_distance = account, d
+            # accounts outside the next ring are at least <ring> buckets away
+            if best is not None and best_distance <= ring * self._grid_size * 111320.0 * math.cos(math.radians(lat)):
+                break
+            ring += 1
+        return best
+
+    def _unindex(self, account):
+        old = self._indexed.pop(account, None)
+        if old is not None:
+            bucket = old[0]
+            self._grid[bucket].discard(account)
+            if not self._grid[bucket]:
+                del self._grid[bucket]
+
+    def _update_index(self, account):
+        self._unindex(account)
+
+        if len(self._backlogs[account]) >= self._backlog_size:
+            return
+
+        # the next job is appended to the end of the path, index the account there
+        backlog = self._backlogs[account]
+        lat, lng = (backlog[-1].lat, backlog[-1].lng) if backlog else self._positions[account]
+        bucket = self._bucket(lat, lng)
+        self._indexed[account] = (bucket, (lat, lng))
+        self._grid.setdefault(bucket, set()).add(account)
+
+    def _bucket(self, lat, lng):
+        return (int(math.floor(lat / self._grid_size)), int(math.floor(lng / self._grid_size)))
@@ -33,4 +33,14 @@ class ServerBusyOrOfflineException(Exception):
     pass
     
 class PleaseInstallProtobufVersion3(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class SlowProtobufBackendException(Exception):
+    pass
+
+class CircuitOpenException(ServerBusyOrOfflineException):
+
+    def __init__(self, endpoint, retry_after):
+        super(CircuitOpenException, self).__init__('Circuit of {} is open, retry in {:.0f}s'.format(endpoint, retry_after))
+        self.endpoint = endpoint
+        self.retry_after = retry_after
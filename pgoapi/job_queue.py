@@ -0,0 +1,283 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from abc import ABCMeta, abstractmethod
+
+import six
+from six.moves.queue import Empty, Full
+
+from pgoapi.scheduler import ScanJob
+from pgoapi.utilities import get_cell_ids, get_cell_id
+
+
+class Job(object):
+
+    def __init__(self, job_id, payload, dedupe_key=None, priority=0, attempts=0, lease=None, created=None):
+        self.id = job_id
+        self.payload = payload
+        self.dedupe_key = dedupe_key
+        self.priority = priority
+        self.attempts = attempts
+        # token of the lease this job was handed out with
+        self.lease = lease
+        self.created = created
+
+
+@six.add_metaclass(ABCMeta)
+class JobQueue(object):
+    """ at-least-once job queue: a job handed out by get() is invisible for the
+    visibility timeout and becomes available again unless it is acked """
+
+    @abstractmethod
+    def put(self, payload, dedupe_key=None, priority=0):
+        pass
+
+    @abstractmethod
+    def get(self, block=True, timeout=None):
+        pass
+
+    @abstractmethod
+    def ack(self, job):
+        pass
+
+    @abstractmethod
+    def nack(self, job, delay=0):
+        pass
+
+    @abstractmethod
+    def extend(self, job, visibility_timeout=None):
+        pass
+
+    @abstractmethod
+    def qsize(self):
+        pass
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+
+class SqliteJobQueue(JobQueue):
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedupe_key TEXT UNIQUE,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            available_at REAL NOT NULL,
+            lease TEXT,
+            leased_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0
+        );
+        DROP INDEX IF EXISTS jobs_ready;
+        CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (priority DESC, id, available_at) WHERE lease IS NULL;
+        CREATE INDEX IF NOT EXISTS jobs_available ON jobs (available_at, created) WHERE lease IS NULL;
+        CREATE INDEX IF NOT EXISTS jobs_leased ON jobs (leased_until, available_at) WHERE lease IS NOT NULL;
+    """
+
+    def __init__(self, path, visibility_timeout=300, poll_interval=0.5, busy_timeout=30):
+        self.log = logging.getLogger(__name__)
+
+        self._path = path
+        self._visibility_timeout = visibility_timeout
+        self._poll_interval = poll_interval
+        self._busy_timeout = busy_timeout
+
+        # sqlite connections must not be shared between threads
+        self._local = threading.local()
+
+        self._conn().executescript(self.SCHEMA)
+
+    def put(self, payload, dedupe_key=None, priority=0):
+        # returns False if a job with the same dedupe key is already queued or leased
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO jobs (dedupe_key, payload, priority, created, available_at) VALUES (?, ?, ?, ?, ?)',
+                (dedupe_key, json.dumps(payload), priority, now, now))
+        return cursor.rowcount == 1
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self._lease()
+            if job is not None:
+                return job
+            if not block or (deadline is not None and time.time() >= deadline):
+                raise Empty
+            time.sleep(self._poll_interval)
+
+    def ack(self, job):
+        # False if the lease expired and the job was handed to somebody else meanwhile
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute('DELETE FROM jobs WHERE id = ? AND lease = ?', (job.id, job.lease))
+        return cursor.rowcount == 1
+
+    def nack(self, job, delay=0):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET lease = NULL, leased_until = NULL, available_at = ? WHERE id = ? AND lease = ?',
+                (time.time() + delay, job.id, job.lease))
+        return cursor.rowcount == 1
+
+    def extend(self, job, visibility_timeout=None):
+        visibility_timeout = visibility_timeout or self._visibility_timeout
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET leased_until = ? WHERE id = ? AND lease = ?',
+                (time.time() + visibility_timeout, job.id, job.lease))
+        return cursor.rowcount == 1
+
+    def qsize(self):
+        return self.stats()['queued']
+
+    def stats(self):
+        # unleased jobs and jobs of expired leases are queried separately, an OR of both could not use the
+        # partial indexes and would scan the table
+        now = time.time()
+        conn = self._conn()
+        queued, oldest = conn.execute(
+            'SELECT COUNT(*), MIN(created) FROM jobs WHERE lease IS NULL AND available_at <= ?', (now,)).fetchone()
+        # nacked with a delay which has not elapsed yet
+        delayed = conn.execute('SELECT COUNT(*) FROM jobs WHERE lease IS NULL AND available_at > ?', (now,)).fetchone()[0]
+        expired, expired_oldest, expired_delayed = conn.execute(
+            'SELECT TOTAL(available_at <= ?), MIN(CASE WHEN available_at <= ? THEN created END), TOTAL(available_at > ?) '
+            'FROM jobs WHERE lease IS NOT NULL AND leased_until < ?', (now, now, now, now)).fetchone()
+        leased = conn.execute('SELECT COUNT(*) FROM jobs WHERE lease IS NOT NULL AND leased_until >= ?', (now,)).fetchone()[0]
+        oldest = min([created for created in (oldest, expired_oldest) if created is not None] or [None])
+        return {
+            'queued': queued + int(expired),
+            'delayed': delayed + int(expired_delayed),
+            'in_flight': leased,
+            'oldest_age': now - oldest if oldest else 0.0,
+        }
+
+    def _lease(self):
+        now = time.time()
+        lease = uuid.uuid4().hex
+        conn = self._conn()
+
+        # BEGIN IMMEDIATE takes the write lock up front, so two nodes can not lease the same row
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # the first unleased job and the first job of an expired lease, one indexed query each
+            rows = [conn.execute(
+                        # walks the queue in order and stops at the first available job instead of sorting all of them
+                        'SELECT id, dedupe_key, payload, priority, attempts, created FROM jobs INDEXED BY jobs_pending '
+                        'WHERE lease IS NULL AND available_at <= ? ORDER BY priority DESC, id LIMIT 1', (now,)).fetchone(),
+                    conn.execute(
+                        'SELECT id, dedupe_key, payload, priority, attempts, created FROM jobs '
+                        'WHERE lease IS NOT NULL AND leased_until < ? AND available_at <= ? '
+                        'ORDER BY priority DESC, id LIMIT 1', (now, now)).fetchone()]
+            rows = [row for row in rows if row is not None]
+            if not rows:
+                conn.execute('COMMIT')
+                return None
+            row = min(rows, key=lambda row: (-row[3], row[0]))
+
+            job_id, dedupe_key, payload, priority, attempts, created = row
+            conn.execute(
+                'UPDATE jobs SET lease = ?, leased_until = ?, attempts = attempts + 1 WHERE id = ?',
+                (lease, now + self._visibility_timeout, job_id))
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+        if attempts:
+            self.log.debug('Job %s handed out again (attempt %s)', job_id, attempts + 1)
+        return Job(job_id, json.loads(payload), dedupe_key, priority, attempts + 1, lease, created)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: transactions are controlled explicitly
+            conn = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+
+class ScanJobQueue(object):
+    """ ScanScheduler compatible front of a JobQueue, deduplicating scans by their origin cell """
+
+    def __init__(self, job_queue, cell_radius=10, maxsize=0):
+        self.log = logging.getLogger(__name__)
+
+        self._queue = job_queue
+        self._cell_radius = cell_radius
+        # queued jobs from which put raises Full, 0 for no bound
+        self._maxsize = maxsize
+
+    def put(self, lat, lng, priority=0, kind=None, cell_ids=None):
+        payload = {'lat': lat, 'lng': lng, 'kind': kind}
+        origin = cell_ids[0] if cell_ids else get_cell_id(lat, lng)
+        dedupe_key = '{}:{}'.format(json.dumps(kind), origin)
+        # checked without a lock, nodes sharing the file may overshoot the bound slightly
+        if self._maxsize:
+            stats = self._queue.stats()
+            # delayed retries are still waiting to be scanned
+            if stats['queued'] + stats.get('delayed', 0) >= self._maxsize:
+                raise Full
+        if not self._queue.put(payload, dedupe_key, priority):
+            self.log.debug('Scan of (%s, %s) already queued', lat, lng)
+        return None
+
+    def get(self, block=True, timeout=None):
+        entry = self._queue.get(block, timeout)
+        payload = entry.payload
+        job = ScanJob(entry.id, payload['lat'], payload['lng'], payload['kind'], entry.priority,
+                      get_cell_ids(payload['lat'], payload['lng'], self._cell_radius))
+        job.submitted = entry.created
+        job.entry = entry
+        return job
+
+    def task_done(self, job):
+        self._queue.ack(job.entry)
+
+    def retry(self, job):
+        self._queue.nack(job.entry)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return self._queue.stats()
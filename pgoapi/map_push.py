@@ -0,0 +1,192 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+import requests
+
+from collections import OrderedDict
+
+from pgoapi.metrics import Counter, Histogram
+
+PUSH_BATCH_SIZE = Histogram('pgoapi_push_batch_size', 'Map objects per pushed batch', buckets=(1, 10, 50, 100, 250, 500, 1000))
+PUSH_DURATION = Histogram('pgoapi_push_duration_seconds', 'Time to post a batch of map objects')
+PUSH_ERRORS = Counter('pgoapi_push_errors_total', 'Batches which could not be pushed')
+
+
+def item_fingerprint(item):
+    # the parts of a pushed map object which are worth an update
+    props = item.get('properties') or {}
+    if item.get('type') == 'pokemon':
+        # an encounter never changes, pushing it once is enough
+        return (item.get('uid'),)
+    return (
+        props.get('LastModifiedMs'),
+        props.get('title'),
+        props.get('marker-color'),
+        props.get('lure'),
+        repr(props.get('lure_info')),
+    )
+
+
+class MapPusher(object):
+
+    def __init__(self, url, bearer, max_batch=500, max_delay=2.0, max_tracked=200000, fingerprint=item_fingerprint,
+                 encounters=None):
+        self.log = logging.getLogger(__name__)
+
+        self._url = url
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._max_tracked = max_tracked
+        self._fingerprint = fingerprint
+        # the EncounterDeduper which dropped repeats before conversion, told about pokemon which were not delivered
+        self._encounters = encounters
+
+        # pooled keep-alive connection, shared by the flusher thread and flush()
+        self._session = requests.session()
+        self._post_lock = threading.Lock()
+        self._session.headers.update({'Authorization': 'Bearer %s' % bearer})
+
+        self._cond = threading.Condition(threading.Lock())
+        # uid -> (queued at, item) waiting to be pushed, a newer version of an object replaces
+        # the older one but keeps its place and time, so the first entry is always the oldest
+        self._pending = OrderedDict()
+        self._first_pending = None
+        # uid -> fingerprint of the last version which was pushed or queued
+        self._seen = OrderedDict()
+
+        self._submitted = 0
+        self._unchanged = 0
+        self._pushed = 0
+        self._batches = 0
+        self._errors = 0
+
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def submit(self, items):
+        # queues the new or changed items and returns how many of them will be pushed
+        changed = 0
+        with self._cond:
+            for item in items:
+                self._submitted += 1
+                uid = item['uid']
+                fingerprint = self._fingerprint(item)
+                if self._seen.get(uid) == fingerprint:
+                    self._unchanged += 1
+                    continue
+
+                self._seen.pop(uid, None)
+                self._seen[uid] = fingerprint
+                queued = self._pending.get(uid)
+                self._pending[uid] = (queued[0] if queued else time.time(), item)
+                changed += 1
+
+            while len(self._seen) > self._max_tracked:
+                self._seen.popitem(last=False)
+
+            if changed:
+                if self._first_pending is None:
+                    self._first_pending = time.time()
+                self._cond.notify()
+        return changed
+
+    def flush(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._post(batch)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'submitted': self._submitted,
+                'unchanged': self._unchanged,
+                'pending': len(self._pending),
+                'pushed': self._pushed,
+                'batches': self._batches,
+                'errors': self._errors,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._batch_ready():
+                    if self._first_pending is None:
+                        self._cond.wait()
+                    else:
+                        self._cond.wait(max(0.0, self._first_pending + self._max_delay - time.time()))
+                batch = self._take_batch()
+            self._post(batch)
+
+    def _batch_ready(self):
+        if not self._pending:
+            return False
+        return len(self._pending) >= self._max_batch or time.time() - self._first_pending >= self._max_delay
+
+    def _take_batch(self):
+        batch = []
+        while self._pending and len(batch) < self._max_batch:
+            batch.append(self._pending.popitem(last=False)[1][1])
+        # leftovers keep the time they were queued at, they must not wait longer than max_delay
+        self._first_pending = next(iter(self._pending.values()))[0] if self._pending else None
+        return batch
+
+    def _post(self, batch):
+        PUSH_BATCH_SIZE.observe(len(batch))
+        start = time.time()
+        try:
+            # requests sessions are not thread safe
+            with self._post_lock:
+                response = self._session.post(self._url, json=batch)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            PUSH_ERRORS.inc()
+            self.log.warning('Push of %s map objects failed: %s', len(batch), e)
+            with self._cond:
+                self._errors += 1
+                # forget the fingerprints so the objects are pushed again with the next scan
+                for item in batch:
+                    self._seen.pop(item['uid'], None)
+            if self._encounters is not None:
+                self._encounters.forget([item['uid'] for item in batch if item.get('type') == 'pokemon'])
+            return
+
+        PUSH_DURATION.observe(time.time() - start)
+        with self._cond:
+            self._pushed += len(batch)
+            self._batches += 1
+        self.log.debug('Pushed %s map objects', len(batch))
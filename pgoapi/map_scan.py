@@ -0,0 +1,111 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+# the map cell scan shared by PGoApi.scan and AsyncPGoApi.scan. scan_steps()
+# holds the cache, retry and dedupe logic but does no IO itself, the caller
+# sends the GET_MAP_OBJECTS requests it yields and sends back the responses.
+
+from __future__ import absolute_import
+
+import time
+import logging
+
+from pgoapi.utilities import get_cell_ids
+
+log = logging.getLogger(__name__)
+
+
+class MapRequest(object):
+    """ a GET_MAP_OBJECTS request of a scan, to be sent after <wait> seconds """
+
+    __slots__ = ('lat', 'lng', 'cell_ids', 'since_timestamp_ms', 'wait')
+
+    def __init__(self, lat, lng, cell_ids, since_timestamp_ms, wait):
+        self.lat = lat
+        self.lng = lng
+        self.cell_ids = cell_ids
+        self.since_timestamp_ms = since_timestamp_ms
+        self.wait = wait
+
+
+def map_cells(response, cell_ids, tracker=None):
+    """ the requested map cells of a GET_MAP_OBJECTS response, None if it failed """
+    map_objects = response and response.get('responses', {}).get('GET_MAP_OBJECTS')
+    if not isinstance(map_objects, dict) or map_objects.get('status') != 1:
+        return None
+    if tracker is None:
+        return map_objects.get('map_cells', [])
+    tracker.update(map_objects)
+    return tracker.get_cells(cell_ids)
+
+
+def scan_steps(points, radius=10, pace=0.3, retries=2, project=None, cache=None, tracker=None, fetched_callback=None):
+    """ yields the map cells around every (lat, lng) of points, and a MapRequest whenever cells have to be
+    requested - the caller answers it with send(response of the request) """
+    # every cell is yielded once, cells covered by an earlier point are not requested again.
+    # cache (a CellCache) answers fresh cells, tracker (a MapCellTracker) makes the requests incremental,
+    # fetched_callback(cells) gets every requested batch and project(cell) transforms the yielded cells
+    seen = set()
+    last_request = 0
+    for lat, lng in points:
+        cell_ids = [cell_id for cell_id in get_cell_ids(lat, lng, radius) if cell_id not in seen]
+        if not cell_ids:
+            continue
+        seen.update(cell_ids)
+
+        missing = cell_ids
+        if cache is not None:
+            fresh, missing = cache.lookup(cell_ids)
+            for cell in fresh.values():
+                yield project(cell) if project else cell
+            if not missing:
+                log.debug('All cells of %s, %s cached', lat, lng)
+                continue
+
+        cells = None
+        for attempt in range(retries + 1):
+            # the server rejects map requests sent faster than about every 0.3s
+            now = time.time()
+            wait = max(0.0, last_request + pace * (attempt + 1) - now)
+            last_request = now + wait
+
+            since = tracker.get_since_timestamps(missing) if tracker is not None else [0] * len(missing)
+            response = yield MapRequest(lat, lng, missing, since, wait)
+            cells = map_cells(response, missing, tracker)
+            if cells is not None:
+                break
+            log.info('Map request at %s, %s failed (attempt %s of %s)', lat, lng, attempt + 1, retries + 1)
+
+        if cells is None:
+            # not yielded, a later point may cover these cells
+            seen.difference_update(missing)
+            continue
+
+        if cache is not None:
+            cache.put_many(cells)
+        if fetched_callback is not None:
+            fetched_callback(cells)
+        for cell in cells:
+            yield project(cell) if project else cell
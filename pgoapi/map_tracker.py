@@ -0,0 +1,179 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import copy
+import logging
+import threading
+
+# repeated MapCell fields which are merged by a key instead of being replaced
+MERGE_KEYS = {
+    'forts': 'id',
+    'fort_summaries': 'fort_summary_id',
+    'wild_pokemons': 'encounter_id',
+    'catchable_pokemons': 'encounter_id',
+}
+
+# repeated MapCell fields without a unique id (collected by their coordinates)
+POINT_FIELDS = ('spawn_points', 'decimated_spawn_points')
+
+
+class MapCellTracker(object):
+
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+
+        # s2 cell id -> last current_timestamp_ms returned by the server
+        self._timestamps = {}
+        # s2 cell id -> {field name -> {key -> object}}
+        self._cells = {}
+        # s2 cell id -> current_timestamp_ms of the latest response (also for truncated cells)
+        self._current = {}
+        # s2 cell id -> {encounter_id -> disappear time in ms}
+        self._disappear = {}
+
+    def get_since_timestamps(self, cell_ids):
+        with self._lock:
+            return [self._timestamps.get(cell_id, 0) for cell_id in cell_ids]
+
+    def update(self, map_objects):
+        """ merges a GET_MAP_OBJECTS response dict into the tracked cell state and returns the updated cell ids """
+        updated = []
+        if not map_objects or 'map_cells' not in map_objects:
+            return updated
+
+        with self._lock:
+            for map_cell in map_objects['map_cells']:
+                cell_id = map_cell.get('s2_cell_id')
+                if cell_id is None:
+                    continue
+                self._merge_cell(cell_id, map_cell)
+                updated.append(cell_id)
+
+        self.log.debug('Merged %s map cells into tracked state', len(updated))
+        return updated
+
+    def get_cell(self, cell_id):
+        with self._lock:
+            return self._build_cell(cell_id)
+
+    def get_cells(self, cell_ids=None):
+        with self._lock:
+            if cell_ids is None:
+                cell_ids = list(self._cells.keys())
+            cells = [self._build_cell(cell_id) for cell_id in cell_ids]
+        return [cell for cell in cells if cell is not None]
+
+    def forget(self, cell_ids):
+        with self._lock:
+            for cell_id in cell_ids:
+                self._timestamps.pop(cell_id, None)
+                self._cells.pop(cell_id, None)
+                self._current.pop(cell_id, None)
+                self._disappear.pop(cell_id, None)
+
+    def _merge_cell(self, cell_id, map_cell):
+        current_ts = map_cell.get('current_timestamp_ms', 0)
+
+        # an unknown cell was requested with since_timestamp_ms=0, so this is a full snapshot
+        if cell_id not in self._cells:
+            self._cells[cell_id] = dict((field, {}) for field in list(MERGE_KEYS) + list(POINT_FIELDS))
+            self._disappear[cell_id] = {}
+
+        state = self._cells[cell_id]
+        disappear = self._disappear[cell_id]
+
+        for deleted in map_cell.get('deleted_objects', []):
+            for field in MERGE_KEYS:
+                objects = state[field]
+                for key in [key for key in objects if str(key) == deleted]:
+                    del objects[key]
+                    disappear.pop(key, None)
+
+        for field, key_name in MERGE_KEYS.items():
+            for obj in map_cell.get(field, []):
+                key = obj.get(key_name)
+                if key is None:
+                    continue
+                state[field][key] = obj
+                if field == 'wild_pokemons' and 'time_till_hidden_ms' in obj:
+                    disappear[key] = current_ts + obj['time_till_hidden_ms']
+
+        for field in POINT_FIELDS:
+            for point in map_cell.get(field, []):
+                state[field][(point.get('latitude'), point.get('longitude'))] = point
+
+        # nearby pokemon have no location and are only valid for the latest response
+        state['nearby_pokemons'] = map_cell.get('nearby_pokemons', [])
+
+        self._current[cell_id] = current_ts
+        self._expire_pokemons(state, disappear, current_ts)
+
+        # a truncated cell has to be requested again from the old timestamp
+        if not map_cell.get('is_truncated_list', False):
+            self._timestamps[cell_id] = current_ts
+
+    def _expire_pokemons(self, state, disappear, now_ms):
+        for encounter_id, disappear_ms in list(disappear.items()):
+            if disappear_ms <= now_ms:
+                state['wild_pokemons'].pop(encounter_id, None)
+                del disappear[encounter_id]
+
+        catchable = state['catchable_pokemons']
+        for encounter_id, pokemon in list(catchable.items()):
+            expiration = pokemon.get('expiration_timestamp_ms')
+            if expiration and expiration <= now_ms:
+                del catchable[encounter_id]
+
+    def _build_cell(self, cell_id):
+        state = self._cells.get(cell_id)
+        if state is None:
+            return None
+
+        current_ts = self._current.get(cell_id, 0)
+        cell = {'s2_cell_id': cell_id, 'current_timestamp_ms': current_ts}
+
+        for field in list(MERGE_KEYS) + list(POINT_FIELDS):
+            if state[field]:
+                cell[field] = list(state[field].values())
+
+        if state['nearby_pokemons']:
+            cell['nearby_pokemons'] = list(state['nearby_pokemons'])
+
+        # time_till_hidden_ms is relative to the response it came from, rebase it on the cell timestamp
+        if 'wild_pokemons' in cell:
+            disappear = self._disappear[cell_id]
+            pokemons = []
+            for pokemon in cell['wild_pokemons']:
+                if pokemon.get('encounter_id') in disappear:
+                    pokemon = copy.copy(pokemon)
+                    pokemon['time_till_hidden_ms'] = disappear[pokemon['encounter_id']] - current_ts
+                pokemons.append(pokemon)
+            cell['wild_pokemons'] = pokemons
+
+        return cell
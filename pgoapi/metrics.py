@@ -0,0 +1,310 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+# minimal metrics in the Prometheus text exposition format, without the client library
+
+from __future__ import absolute_import
+
+import time
+import threading
+
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds, from a cached cell lookup up to a slow RPC
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# bytes of a response or number of items
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Metric {} is already registered'.format(metric.name))
+            self._metrics[metric.name] = metric
+            return metric
+
+    def get_or_create(self, metric_class, name, documentation, labelnames=(), **kwargs):
+        """ the registered metric of that name, created on first use - for code which may run several
+        times in one process, e.g. a script which is also imported as module """
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is None:
+                metric = metric_class(name, documentation, labelnames, registry=None, **kwargs)
+                self._metrics[name] = metric
+                return metric
+        if type(existing) is not metric_class or existing.labelnames != tuple(labelnames):
+            raise ValueError('Metric {} already registered with another type or labels'.format(name))
+        return existing
+
+    def get(self, name):
+        with self._lock:
+            return self._metrics.get(name)
+
+    def exposition(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, _escape(metric.documentation)))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def exposition(registry=None):
+    return (registry or REGISTRY).exposition()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, _escape(value)) for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class _Metric(object):
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._lock = threading.Lock()
+        # label values -> child holding the value(s)
+        self._children = {}
+        self._function = None
+
+        if not self.labelnames:
+            # unlabelled metrics are exported as zero until they are first used
+            self.labels()
+
+        # registered last, the exposition may run in another thread as soon as it is visible
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError('{} expects the labels {}'.format(self.name, self.labelnames))
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def set_function(self, function):
+        # the value is read from function() on every collection, e.g. the size of a queue
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            return [(self.name, (), self._function())]
+        with self._lock:
+            children = sorted(self._children.items())
+        samples = []
+        for values, child in children:
+            samples.extend(child.samples(self.name, list(zip(self.labelnames, values))))
+        return samples
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError('{} has labels, use labels() first'.format(self.name))
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+
+class _Value(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def set(self, value):
+        with self._lock:
+            self._value = float(value)
+
+    def get(self):
+        with self._lock:
+            return self._value
+
+    def samples(self, name, labels):
+        return [(name, labels, self.get())]
+
+
+class Counter(_Metric):
+
+    type = 'counter'
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Counters can only be increased')
+        self._default().inc(amount)
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+
+    type = 'gauge'
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().inc(-amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+    def _new_child(self):
+        return _Value()
+
+
+class _HistogramValue(object):
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start)
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self._buckets, counts):
+            cumulative += bucket_count
+            samples.append((name + '_bucket', labels + [('le', _format_value(float(bound)))], cumulative))
+        samples.append((name + '_bucket', labels + [('le', '+Inf')], count))
+        samples.append((name + '_sum', labels, total))
+        samples.append((name + '_count', labels, count))
+        return samples
+
+
+class Histogram(_Metric):
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        super(Histogram, self).__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+class ScannerMetrics(object):
+    """ metrics of a scanner front-end (new_server, add_to_map): scans and cooldowns per account,
+    the scan queue, the cell cache and the admission control """
+
+    def __init__(self, queue, cell_cache, admission, registry=REGISTRY):
+        self.scans = registry.get_or_create(Counter, 'scanner_scans_total', 'Finished scan jobs by account and result', ['account', 'result'])
+        self.relogins = registry.get_or_create(Counter, 'scanner_relogins_total', 'Logins after a failed scan by account', ['account'])
+        self.scan_duration = registry.get_or_create(Histogram, 'scanner_scan_duration_seconds', 'Time to complete a scan job')
+        self.cooldown_seconds = registry.get_or_create(Counter, 'scanner_cooldown_seconds_total', 'Time accounts waited before they could scan again', ['account', 'reason'])
+        self.cooling_down = registry.get_or_create(Gauge, 'scanner_account_cooling_down', 'Whether the account is currently waiting', ['account'])
+
+        registry.get_or_create(Gauge, 'scanner_queue_depth', 'Queued scan jobs').set_function(queue.qsize)
+        registry.get_or_create(Gauge, 'scanner_queue_oldest_age_seconds', 'Age of the oldest queued scan job').set_function(
+            lambda: queue.stats()['oldest_age'])
+        registry.get_or_create(Counter, 'scanner_jobs_deduped_total', 'Scan jobs merged into queued ones').set_function(
+            lambda: queue.stats().get('deduped', 0))
+        registry.get_or_create(Counter, 'scanner_cell_cache_hits_total', 'Map cells answered from the cache').set_function(
+            lambda: cell_cache.stats()['hits'])
+        registry.get_or_create(Counter, 'scanner_cell_cache_misses_total', 'Map cells which had to be requested').set_function(
+            lambda: cell_cache.stats()['misses'])
+        registry.get_or_create(Gauge, 'scanner_cell_cache_hit_ratio', 'Share of map cells answered from the cache').set_function(
+            lambda: cell_cache.stats()['hit_rate'])
+        registry.get_or_create(Counter, 'scanner_admission_rejected_total', 'Scan requests answered with 429').set_function(
+            lambda: admission.stats()['throttled'] + admission.stats()['saturated'])
+
+    def cooldown(self, account, seconds, reason):
+        # sleeps while the account can not scan, e.g. because the circuit of its endpoint is open
+        waiting = self.cooling_down.labels(account)
+        waiting.set(1)
+        try:
+            time.sleep(seconds)
+        finally:
+            waiting.set(0)
+            self.cooldown_seconds.labels(account, reason).inc(seconds)
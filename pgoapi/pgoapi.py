@@ -27,16 +27,20 @@ from __future__ import absolute_import
 
 import logging
 import re
+import time
 import requests
 
 from .utilities import f2i, h2f
 from pgoapi.rpc_api import RpcApi
 from pgoapi.auth_ptc import AuthPtc
-from pgoapi.auth_google import AuthGoogle
-from pgoapi.exceptions import AuthException, NotLoggedInException, ServerBusyOrOfflineException
+from pgoapi.exceptions import AuthException, NotLoggedInException, ServerBusyOrOfflineException, CircuitOpenException
+from pgoapi.concurrency import SUCCESS, BUSY, ERROR, IGNORE
+from pgoapi.map_scan import MapRequest, scan_steps
 
 from . import protos
-from POGOProtos.Networking.Requests_pb2 import RequestType
+from pgoapi.protos import LazyProto
+
+RequestType = LazyProto('POGOProtos.Networking.Requests_pb2.RequestType')
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +60,20 @@ class PGoApi:
         self._position_alt = 0
 
         self._req_method_list = []
+
+        # RequestType -> callbacks receiving the parsed protobuf response
+        self._response_hooks = {}
+        # RequestType -> callable replacing the protobuf parse of the serialized response
+        self._raw_handlers = {}
+
+        # (phase, seconds) of the last login
+        self._login_timings = []
+
+        # optional ConcurrencyController shared by all PGoApi instances of a process
+        self._concurrency = None
+        self._account = None
+        # optional EndpointHealth, calls to an endpoint with an open circuit raise CircuitOpenException
+        self._endpoint_health = None
         
     def call(self):
         if not self._req_method_list:
@@ -67,19 +85,38 @@ class PGoApi:
         
         player_position = self.get_position()
         
-        request = RpcApi(self._auth_provider)
+        request = RpcApi(self._auth_provider, self._response_hooks, self._raw_handlers)
         
         if self._api_endpoint:
             api_endpoint = self._api_endpoint
         else:
             api_endpoint = self.API_ENTRY
         
+        permit = self._endpoint_health.allow(api_endpoint) if self._endpoint_health else None
+        if self._endpoint_health and permit is None:
+            self._req_method_list = []
+            # a half open circuit whose probe is still running has no retry time, try again shortly
+            raise CircuitOpenException(api_endpoint, max(1.0, self._endpoint_health.retry_after(api_endpoint)))
+
         self.log.info('Execution of RPC')
         response = None
+        slots = None
+        if self._concurrency:
+            slots = self._concurrency.acquire(api_endpoint, self._account)
+        outcome = IGNORE
+        start = time.time()
         try:
             response = request.request(api_endpoint, self._req_method_list, player_position)
+            # False for non-200 answers and unparsable responses
+            outcome = SUCCESS if response else ERROR
         except ServerBusyOrOfflineException as e:
+            outcome = BUSY
             self.log.info('Server seems to be busy or offline - try again!')
+        finally:
+            if slots:
+                self._concurrency.release(slots, outcome, time.time() - start)
+            if self._endpoint_health:
+                self._endpoint_health.record(api_endpoint, outcome, permit)
         
         # cleanup after call execution
         self.log.info('Cleanup of request!')
@@ -87,10 +124,62 @@ class PGoApi:
         
         return response
 
+    def scan(self, points, radius=10, pace=0.3, retries=2, project=None, cache=None, tracker=None, fetched_callback=None):
+        """ yields the map cells around every (lat, lng) of points as soon as their response arrived """
+        # see pgoapi.map_scan.scan_steps for the arguments
+        steps = scan_steps(points, radius, pace, retries, project, cache, tracker, fetched_callback)
+        try:
+            step = next(steps)
+            while True:
+                if not isinstance(step, MapRequest):
+                    yield step
+                    step = next(steps)
+                    continue
+                if step.wait:
+                    time.sleep(step.wait)
+                self.set_position(step.lat, step.lng, 0)
+                self.get_map_objects(latitude=f2i(step.lat), longitude=f2i(step.lng),
+                                     since_timestamp_ms=step.since_timestamp_ms, cell_id=step.cell_ids)
+                step = steps.send(self.call())
+        except StopIteration:
+            return
+
     def list_curr_methods(self):
         for i in self._req_method_list:
             print("{} ({})".format(RequestType.Name(i),i))
     
+    def add_response_hook(self, request_type, callback):
+        # callback(response_proto) is called with every parsed response of this type, before the dict conversion
+        if not isinstance(request_type, int):
+            request_type = RequestType.Value(request_type.upper())
+        self._response_hooks.setdefault(request_type, []).append(callback)
+
+    def set_raw_handler(self, request_type, handler):
+        # handler(serialized_response) returns what is put into responses instead of the dict,
+        # e.g. pgoapi.wire.wild_pokemons. Response hooks are not called for this type anymore.
+        # serialized_response is a memoryview of the receive buffer, it must not be kept.
+        if not isinstance(request_type, int):
+            request_type = RequestType.Value(request_type.upper())
+        if handler is None:
+            self._raw_handlers.pop(request_type, None)
+        else:
+            self._raw_handlers[request_type] = handler
+
+    def set_concurrency_controller(self, controller, account=None):
+        # RPCs wait for a slot of the endpoint and of the account, see pgoapi.concurrency
+        self._concurrency = controller
+        if account is not None:
+            self._account = account
+
+    def set_endpoint_health(self, endpoint_health):
+        self._endpoint_health = endpoint_health
+
+    def get_api_endpoint(self):
+        return self._api_endpoint or self.API_ENTRY
+
+    def get_login_timings(self):
+        return list(self._login_timings)
+
     def set_logger(self, logger):
         self._ = logger or logging.getLogger(__name__)
 
@@ -135,17 +224,28 @@ class PGoApi:
         if provider == 'ptc':
             self._auth_provider = AuthPtc()
         elif provider == 'google':
+            # gpsoauth and its crypto dependencies are only loaded for google accounts
+            from pgoapi.auth_google import AuthGoogle
             self._auth_provider = AuthGoogle()
         else:
             raise AuthException("Invalid authentication provider - only ptc/google available.")
             
         self.log.debug('Auth provider: %s', provider)
+        self._login_timings = []
+        # the login sequence goes to the entry point again, which may hand out another endpoint
+        self._api_endpoint = None
+        if self._account is None:
+            self._account = username
         
-        if not self._auth_provider.login(username, password):
+        start = time.time()
+        logged_in = self._auth_provider.login(username, password)
+        self._login_timings.append(('auth_{}'.format(provider), time.time() - start))
+        if not logged_in:
             self.log.info('Login process failed') 
             return False
         
         self.log.info('Starting RPC login sequence (app simulation)')
+        start = time.time()
         
         # making a standard call, like it is also done by the client
         self.get_player()
@@ -155,6 +255,7 @@ class PGoApi:
         self.download_settings(hash="05daf51635c82611d1aac95c0b051d3ec088a930")
         
         response = self.call()
+        self._login_timings.append(('rpc_login', time.time() - start))
         
         if not response: 
             self.log.info('Login failed!') 
@@ -0,0 +1,196 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import math
+import time
+import heapq
+import logging
+import threading
+
+from pgoapi.records import Fort, WildPokemon
+
+EARTH_RADIUS = 6371000.0
+
+
+def distance(lat1, lng1, lat2, lng2):
+    # haversine distance in meters
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class PoiIndex(object):
+
+    def __init__(self, grid_size=0.005):
+        self.log = logging.getLogger(__name__)
+
+        # edge length of a grid bucket in degrees (~500m in latitude)
+        self._grid_size = grid_size
+
+        self._lock = threading.Lock()
+        # (kind, id) -> Fort or WildPokemon record
+        self._objects = {}
+        # grid bucket -> set of (kind, id)
+        self._grid = {}
+        # encounter id -> disappear time in ms, ordered by the heap below
+        self._disappear = {}
+        self._expiry = []
+
+    def add_map_cells(self, map_cells):
+        with self._lock:
+            for cell in map_cells:
+                now_ms = cell.get('current_timestamp_ms') or int(time.time() * 1000)
+                for fort in cell.get('forts', []):
+                    self._add_fort(fort)
+                for pokemon in cell.get('wild_pokemons', []):
+                    self._add_pokemon(pokemon, now_ms)
+
+    def add_fort(self, fort):
+        with self._lock:
+            self._add_fort(fort)
+
+    def add_pokemon(self, pokemon, now_ms=None):
+        with self._lock:
+            self._add_pokemon(pokemon, now_ms or int(time.time() * 1000))
+
+    def query_bbox(self, south, west, north, east, kind=None):
+        results = []
+        with self._lock:
+            self._expire(int(time.time() * 1000))
+            for key in self._keys_in_bbox(south, west, north, east):
+                if kind is not None and key[0] != kind:
+                    continue
+                obj = self._objects[key]
+                if south <= obj.latitude <= north and west <= obj.longitude <= east:
+                    results.append(obj.to_dict())
+        return results
+
+    def query_radius(self, lat, lng, radius, kind=None):
+        # radius in meters
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+
+        results = []
+        with self._lock:
+            self._expire(int(time.time() * 1000))
+            for key in self._keys_in_bbox(lat - dlat, lng - dlng, lat + dlat, lng + dlng):
+                if kind is not None and key[0] != kind:
+                    continue
+                obj = self._objects[key]
+                if distance(lat, lng, obj.latitude, obj.longitude) <= radius:
+                    results.append(obj.to_dict())
+        return results
+
+    def get_disappear_time(self, encounter_id):
+        with self._lock:
+            return self._disappear.get(encounter_id)
+
+    def expire(self, now_ms=None):
+        with self._lock:
+            return self._expire(now_ms or int(time.time() * 1000))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'forts': len(self._objects) - len(self._disappear),
+                'pokemons': len(self._disappear),
+                'buckets': len(self._grid),
+            }
+
+    def _add_fort(self, fort):
+        if isinstance(fort, dict):
+            fort = Fort.from_dict(fort)
+        self._add('fort', fort.id, fort)
+
+    def _add_pokemon(self, pokemon, now_ms):
+        # dicts are stored as compact records, see pgoapi.records
+        if isinstance(pokemon, dict):
+            pokemon = WildPokemon.from_dict(pokemon, now_ms)
+        encounter_id = pokemon.encounter_id
+        disappear_ms = pokemon.disappear_ms
+        if disappear_ms <= now_ms:
+            return
+
+        self._add('pokemon', encounter_id, pokemon)
+        if self._disappear.get(encounter_id) != disappear_ms:
+            self._disappear[encounter_id] = disappear_ms
+            heapq.heappush(self._expiry, (disappear_ms, encounter_id))
+
+    def _add(self, kind, obj_id, obj):
+        key = (kind, obj_id)
+
+        old = self._objects.get(key)
+        if old is not None:
+            bucket = self._bucket(old.latitude, old.longitude)
+            if bucket != self._bucket(obj.latitude, obj.longitude):
+                self._remove_from_bucket(bucket, key)
+
+        self._objects[key] = obj
+        self._grid.setdefault(self._bucket(obj.latitude, obj.longitude), set()).add(key)
+
+    def _expire(self, now_ms):
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now_ms:
+            disappear_ms, encounter_id = heapq.heappop(self._expiry)
+            # outdated heap entry, the pokemon was seen again with a new disappear time
+            if self._disappear.get(encounter_id) != disappear_ms:
+                continue
+
+            del self._disappear[encounter_id]
+            key = ('pokemon', encounter_id)
+            obj = self._objects.pop(key)
+            self._remove_from_bucket(self._bucket(obj.latitude, obj.longitude), key)
+            expired += 1
+        return expired
+
+    def _remove_from_bucket(self, bucket, key):
+        keys = self._grid.get(bucket)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self._grid[bucket]
+
+    def _bucket(self, lat, lng):
+        return (int(math.floor(lat / self._grid_size)), int(math.floor(lng / self._grid_size)))
+
+    def _keys_in_bbox(self, south, west, north, east):
+        min_x, min_y = self._bucket(south, west)
+        max_x, max_y = self._bucket(north, east)
+
+        # for large areas walking the occupied buckets is cheaper than walking the area
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self._grid):
+            for (x, y), keys in self._grid.items():
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    for key in keys:
+                        yield key
+            return
+
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                for key in self._grid.get((x, y), ()):
+                    yield key
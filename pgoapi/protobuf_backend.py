@@ -0,0 +1,91 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+# The protobuf runtime parses several times faster with its C backends (cpp
+# or upb) than with the pure python one. The backend is chosen by protobuf at
+# import time, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python forces the slow one.
+
+from __future__ import absolute_import
+
+import os
+import logging
+
+from pgoapi.exceptions import SlowProtobufBackendException
+from pgoapi.metrics import Gauge
+
+log = logging.getLogger(__name__)
+
+# set to refuse the pure python backend, e.g. in production
+STRICT_ENV = 'PGOAPI_STRICT_PROTOBUF'
+
+PYTHON = 'python'
+CPP = 'cpp'
+UPB = 'upb'
+
+BACKEND_INFO = Gauge('pgoapi_protobuf_backend_info', 'Active protobuf backend', ['backend', 'version'])
+
+
+def get_backend():
+    """ the active protobuf backend: 'python', 'cpp' or 'upb' """
+    try:
+        from google.protobuf.internal import api_implementation
+    except ImportError:
+        return PYTHON
+    return api_implementation.Type()
+
+
+def get_version():
+    try:
+        from google.protobuf import __version__ as version
+    except ImportError:
+        return None
+    return version
+
+
+def is_fast_backend(backend=None):
+    return (backend or get_backend()) != PYTHON
+
+
+def is_strict():
+    return os.environ.get(STRICT_ENV, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def check_backend(strict=None, source=None):
+    """ reports the active backend, raises SlowProtobufBackendException for the python one in strict mode """
+    # strict defaults to the PGOAPI_STRICT_PROTOBUF environment, source names where an explicit one came from
+    backend = get_backend()
+    version = get_version()
+    BACKEND_INFO.labels(backend, version or '').set(1)
+
+    if strict is None:
+        strict, source = is_strict(), STRICT_ENV
+    if is_fast_backend(backend):
+        log.info('protobuf %s with the %s backend', version, backend)
+    elif strict:
+        raise SlowProtobufBackendException(
+            'protobuf {} uses the pure python backend, refused by {}'.format(version, source or 'check_backend(strict=True)'))
+    else:
+        log.info('protobuf %s with the pure python backend, parsing is several times slower than with cpp or upb', version)
+    return backend
@@ -1,6 +1,37 @@
-
 import os
 import sys
 
+from importlib import import_module
+
 # add directory of this file to PATH, so that the package will be found
-sys.path.append(os.path.dirname(os.path.realpath(__file__)))
\ No newline at end of file
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+# generated modules are only imported when one of their types is used first
+_classes = {}
+
+
+def get_class(name):
+    # e.g. 'POGOProtos.Networking.Envelopes_pb2.RequestEnvelope'
+    cls = _classes.get(name)
+    if cls is None:
+        module_, class_ = name.rsplit('.', 1)
+        cls = _classes[name] = getattr(import_module(module_), class_)
+    return cls
+
+
+class LazyProto(object):
+    """ stands in for a generated message or enum class until it is used """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return get_class(self._name)(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        if attr.startswith('__') or attr == '_name':
+            raise AttributeError(attr)
+        return getattr(get_class(self._name), attr)
+
+    def __repr__(self):
+        return '<LazyProto {}>'.format(self._name)
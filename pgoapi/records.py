@@ -0,0 +1,217 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+# compact map objects for long living indexes. A wild pokemon dict from
+# protobuf_to_dict costs around 650 bytes, its record about a fifth of that.
+
+from __future__ import absolute_import
+
+import time
+
+from six.moves import intern
+
+from pgoapi.protobuf_to_dict import protobuf_to_dict
+
+# FortData.type / owned_by_team
+GYM = 0
+CHECKPOINT = 1
+BLUE = 1
+RED = 2
+YELLOW = 3
+
+TEAM_MARKERS = {
+    BLUE: ("0000FF", "Blue Gym"),
+    RED: ("FF0000", "Red Gym"),
+    YELLOW: ("FF0000", "Yellow Gym"),
+}
+
+
+def _intern(value):
+    # ids of forts and spawn points are repeated in every scan, keep one copy of each
+    if value is None:
+        return None
+    return intern(str(value))
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class Fort(object):
+
+    __slots__ = ('id', 'latitude', 'longitude', 'type', 'owned_by_team', 'guard_pokemon_id',
+                 'gym_points', 'last_modified_ms', 'lure_info')
+
+    def __init__(self, fort_id, latitude, longitude, fort_type=GYM, owned_by_team=0, guard_pokemon_id=0,
+                 gym_points=0, last_modified_ms=0, lure_info=None):
+        self.id = _intern(fort_id)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.type = fort_type
+        self.owned_by_team = owned_by_team
+        self.guard_pokemon_id = guard_pokemon_id
+        self.gym_points = gym_points
+        self.last_modified_ms = last_modified_ms
+        # dict of the FortLureInfo, only set for lured pokestops
+        self.lure_info = lure_info
+
+    @classmethod
+    def from_proto(cls, fort):
+        lure_info = protobuf_to_dict(fort.lure_info) if fort.HasField('lure_info') else None
+        return cls(fort.id, fort.latitude, fort.longitude, fort.type, fort.owned_by_team, fort.guard_pokemon_id,
+                   fort.gym_points, fort.last_modified_timestamp_ms, lure_info)
+
+    @classmethod
+    def from_dict(cls, fort):
+        return cls(fort['id'], fort['latitude'], fort['longitude'], fort.get('type', GYM), fort.get('owned_by_team', 0),
+                   fort.get('guard_pokemon_id', 0), fort.get('gym_points', 0), fort.get('last_modified_timestamp_ms', 0),
+                   fort.get('lure_info'))
+
+    def to_dict(self):
+        # the protobuf_to_dict layout, unset fields are left out
+        fort = {'id': self.id, 'latitude': self.latitude, 'longitude': self.longitude,
+                'last_modified_timestamp_ms': self.last_modified_ms}
+        for key, value in (('type', self.type), ('owned_by_team', self.owned_by_team),
+                           ('guard_pokemon_id', self.guard_pokemon_id), ('gym_points', self.gym_points),
+                           ('lure_info', self.lure_info)):
+            if value:
+                fort[key] = value
+        return fort
+
+    def to_push_item(self):
+        props = {
+            "id": self.id,
+            "LastModifiedMs": self.last_modified_ms,
+            }
+        if self.type == CHECKPOINT:
+            props["marker-symbol"] = "circle"
+            props["title"] = "PokeStop"
+            props["type"] = "pokestop"
+            props["lure"] = self.lure_info is not None
+        else:
+            props["marker-symbol"] = "town-hall"
+            props["marker-size"] = "large"
+            props["type"] = "gym"
+
+        if self.owned_by_team:
+            marker = TEAM_MARKERS.get(self.owned_by_team)
+            if marker:
+                props["marker-color"], props["title"] = marker
+        else:
+            if self.lure_info is not None:
+                props["lure"] = True
+                props["lure_info"] = self.lure_info
+            props["marker-color"] = "808080"
+
+        location = {"type": "Point", "coordinates": [self.longitude, self.latitude]}
+        return {"type": props["type"], "uid": self.id, "location": location, "properties": props}
+
+
+class WildPokemon(object):
+
+    __slots__ = ('encounter_id', 'spawnpoint_id', 'pokemon_id', 'latitude', 'longitude', 'disappear_ms',
+                 'last_modified_ms')
+
+    def __init__(self, encounter_id, spawnpoint_id, pokemon_id, latitude, longitude, disappear_ms, last_modified_ms=0):
+        self.encounter_id = encounter_id
+        self.spawnpoint_id = _intern(spawnpoint_id)
+        self.pokemon_id = pokemon_id
+        self.latitude = latitude
+        self.longitude = longitude
+        # absolute, time_till_hidden_ms is only valid at the time of the response
+        self.disappear_ms = disappear_ms
+        self.last_modified_ms = last_modified_ms
+
+    @classmethod
+    def from_proto(cls, pokemon, now_ms=None):
+        now_ms = now_ms or _now_ms()
+        return cls(pokemon.encounter_id, pokemon.spawnpoint_id, pokemon.pokemon_data.pokemon_id, pokemon.latitude,
+                   pokemon.longitude, now_ms + pokemon.time_till_hidden_ms, pokemon.last_modified_timestamp_ms)
+
+    @classmethod
+    def from_dict(cls, pokemon, now_ms=None):
+        now_ms = now_ms or _now_ms()
+        return cls(pokemon['encounter_id'], pokemon.get('spawnpoint_id'), pokemon['pokemon_data']['pokemon_id'],
+                   pokemon['latitude'], pokemon['longitude'], now_ms + pokemon.get('time_till_hidden_ms', 0),
+                   pokemon.get('last_modified_timestamp_ms', 0))
+
+    def time_till_hidden_ms(self, now_ms=None):
+        return self.disappear_ms - (now_ms or _now_ms())
+
+    def to_dict(self, now_ms=None):
+        return {
+            'encounter_id': self.encounter_id,
+            'spawnpoint_id': self.spawnpoint_id,
+            'pokemon_data': {'pokemon_id': self.pokemon_id},
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'time_till_hidden_ms': self.time_till_hidden_ms(now_ms),
+            'last_modified_timestamp_ms': self.last_modified_ms,
+        }
+
+    def to_push_item(self, names=None, now_ms=None):
+        # names: pokenames.json, pokemon id as string -> name
+        now_ms = now_ms or _now_ms()
+        props = {
+            "id": "wild%s" % self.encounter_id,
+            "type": "wild",
+            "pokemonNumber": self.pokemon_id,
+            "TimeTillHiddenMs": self.disappear_ms - now_ms,
+            "WillDisappear": self.disappear_ms,
+            "marker-color": "FF0000"
+            }
+        if names is not None:
+            props["title"] = "Wild %s" % names[str(self.pokemon_id)]
+        location = {"type": "Point", "coordinates": [self.longitude, self.latitude]}
+        return {"type": "pokemon", "uid": self.encounter_id, "location": location, "properties": props}
+
+
+class SpawnPoint(object):
+
+    __slots__ = ('id', 'latitude', 'longitude')
+
+    def __init__(self, spawnpoint_id, latitude, longitude):
+        # the map cell's spawn_points carry no id, only wild pokemon do
+        self.id = _intern(spawnpoint_id)
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @classmethod
+    def from_proto(cls, spawn_point, spawnpoint_id=None):
+        return cls(spawnpoint_id, spawn_point.latitude, spawn_point.longitude)
+
+    @classmethod
+    def from_dict(cls, spawn_point):
+        return cls(spawn_point.get('spawnpoint_id'), spawn_point['latitude'], spawn_point['longitude'])
+
+    @classmethod
+    def from_pokemon(cls, pokemon):
+        return cls(pokemon.spawnpoint_id, pokemon.latitude, pokemon.longitude)
+
+    def to_dict(self):
+        spawn_point = {'latitude': self.latitude, 'longitude': self.longitude}
+        if self.id is not None:
+            spawn_point['spawnpoint_id'] = self.id
+        return spawn_point
@@ -26,24 +26,60 @@ Author: tjado <https://github.com/tejado>
 from __future__ import absolute_import
 
 import re
+import time
 import logging
 import requests
+import threading
 import subprocess
 
-from importlib import import_module
+from google.protobuf.message import DecodeError
 
 from pgoapi.protobuf_to_dict import protobuf_to_dict
 from pgoapi.exceptions import NotLoggedInException, ServerBusyOrOfflineException
 from pgoapi.utilities import f2i, h2f, to_camel_case
+from pgoapi.metrics import Counter, Histogram, SIZE_BUCKETS
+from pgoapi.wire import split_envelope, WireError
 
 from . import protos
-from POGOProtos.Networking.Envelopes_pb2 import RequestEnvelope
-from POGOProtos.Networking.Envelopes_pb2 import ResponseEnvelope
-from POGOProtos.Networking.Requests_pb2 import RequestType
+from pgoapi.protos import LazyProto
+
+RequestEnvelope = LazyProto('POGOProtos.Networking.Envelopes_pb2.RequestEnvelope')
+ResponseEnvelope = LazyProto('POGOProtos.Networking.Envelopes_pb2.ResponseEnvelope')
+RequestType = LazyProto('POGOProtos.Networking.Requests_pb2.RequestType')
+
+RPC_DURATION = Histogram('pgoapi_rpc_duration_seconds', 'Round trip time of RPCs containing the request type', ['request'])
+RPC_ERRORS = Counter('pgoapi_rpc_errors_total', 'Failed RPCs by reason', ['reason'])
+RESPONSE_BYTES = Histogram('pgoapi_response_bytes', 'Size of the sub responses', ['request'], buckets=SIZE_BUCKETS)
+PARSE_DURATION = Histogram('pgoapi_parse_duration_seconds', 'Time spent parsing and converting a sub response', ['request'])
+
+# bytes handed to the socket per read
+CHUNK_SIZE = 64 * 1024
+
+# one receive buffer per thread, RpcApi instances only live for a single call
+_buffers = threading.local()
+
+
+def _receive_buffer(size, keep=0):
+    buf = getattr(_buffers, 'buf', None)
+    if buf is None or len(buf) < size:
+        # replaced instead of resized, a view of the old buffer may still be alive
+        new_buf = bytearray(max(size, CHUNK_SIZE))
+        if keep:
+            new_buf[:keep] = memoryview(buf)[:keep]
+        buf = _buffers.buf = new_buf
+    return buf
+
+
+def _parse_from(message, data):
+    # the python and upb runtimes parse from any buffer, older cpp runtimes only from bytes
+    try:
+        message.ParseFromString(data)
+    except TypeError:
+        message.ParseFromString(bytes(data))
 
 class RpcApi:
     
-    def __init__(self, auth_provider):
+    def __init__(self, auth_provider, response_hooks=None, raw_handlers=None):
     
         self.log = logging.getLogger(__name__)
     
@@ -52,6 +88,8 @@ class RpcApi:
         self._session.verify = True
         
         self._auth_provider = auth_provider
+        self._response_hooks = response_hooks or {}
+        self._raw_handlers = raw_handlers or {}
     
     def get_rpc_id(self):
         return 8145806132888207460
@@ -67,20 +105,37 @@ class RpcApi:
         return output
     
     def get_class(self, cls):
-        module_, class_ = cls.rsplit('.', 1)
-        class_ = getattr(import_module(module_), class_)
-        return class_
+        return protos.get_class(cls)
         
     def _make_rpc(self, endpoint, request_proto_plain):
         self.log.debug('Execution of RPC')
         
         request_proto_serialized = request_proto_plain.SerializeToString()
+        body = None
         try:
-            http_response = self._session.post(endpoint, data=request_proto_serialized)
-        except requests.exceptions.ConnectionError as e:
+            http_response = self._session.post(endpoint, data=request_proto_serialized, stream=True)
+            if http_response.status_code == 200:
+                body = self._read_body(http_response)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            RPC_ERRORS.labels('connection').inc()
             raise ServerBusyOrOfflineException
         
-        return http_response
+        return http_response, body
+
+    def _read_body(self, http_response):
+        # the body goes straight into the receive buffer of this thread, the returned view
+        # is only valid until the next RPC of the thread
+        length = int(http_response.headers.get('Content-Length') or 0)
+        buf = _receive_buffer(length)
+        pos = 0
+        for chunk in http_response.iter_content(CHUNK_SIZE):
+            end = pos + len(chunk)
+            if end > len(buf):
+                # compressed or without Content-Length
+                buf = _receive_buffer(max(end, 2 * len(buf)), keep=pos)
+            buf[pos:end] = chunk
+            pos = end
+        return memoryview(buf)[:pos]
     
     def request(self, endpoint, subrequests, player_position):
     
@@ -88,9 +143,13 @@ class RpcApi:
             raise NotLoggedInException()
     
         request_proto = self._build_main_request(subrequests, player_position)
-        response = self._make_rpc(endpoint, request_proto)
+        start = time.time()
+        response, body = self._make_rpc(endpoint, request_proto)
+        elapsed = time.time() - start
+        for entry in subrequests:
+            RPC_DURATION.labels(RequestType.Name(self._request_type(entry))).observe(elapsed)
         
-        response_dict = self._parse_main_response(response, subrequests)
+        response_dict = self._parse_main_response(response, body, subrequests)
         
         return response_dict
     
@@ -172,53 +231,53 @@ class RpcApi:
         return mainrequest
         
     
-    def _parse_main_response(self, response_raw, subrequests):
+    def _parse_main_response(self, response_raw, body, subrequests):
         self.log.debug('Parsing main RPC response...')
         
         if response_raw.status_code != 200:
+            RPC_ERRORS.labels('http_{}'.format(response_raw.status_code)).inc()
             self.log.warning('Unexpected HTTP server response - needs 200 got %s', response_raw.status_code)
-            self.log.debug('HTTP output: \n%s', response_raw.content.decode('utf-8'))
+            self.log.debug('HTTP output: \n%s', response_raw.text)
             return False
         
-        if response_raw.content is None:
+        if not body:
+            RPC_ERRORS.labels('empty').inc()
             self.log.warning('Empty server response!')
             return False
     
+        # the sub responses stay views of the body, only the small rest is copied and parsed
         response_proto = ResponseEnvelope()
         try:
-            response_proto.ParseFromString(response_raw.content)
-        except google.protobuf.message.DecodeError as e:
+            envelope, returns = split_envelope(body)
+            _parse_from(response_proto, envelope)
+        except (DecodeError, WireError) as e:
+            RPC_ERRORS.labels('decode').inc()
             self.log.warning('Could not parse response: %s', str(e))
             return False
         
-        self.log.debug('Protobuf structure of rpc response:\n\r%s', response_proto)
-        try:
-            self.log.debug('Decode raw over protoc (protoc has to be in your PATH):\n\r%s', self.decode_raw(response_raw.content).decode('utf-8'))
-        except:
-            self.log.debug('Error during protoc parsing - ignored.')
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug('Protobuf structure of rpc response:\n\r%s', response_proto)
+            try:
+                self.log.debug('Decode raw over protoc (protoc has to be in your PATH):\n\r%s', self.decode_raw(bytes(body)).decode('utf-8'))
+            except:
+                self.log.debug('Error during protoc parsing - ignored.')
        
         response_proto_dict = protobuf_to_dict(response_proto)
-        response_proto_dict = self._parse_sub_responses(response_proto, subrequests, response_proto_dict)
+        response_proto_dict = self._parse_sub_responses(returns, subrequests, response_proto_dict)
         
         return response_proto_dict
     
-    def _parse_sub_responses(self, response_proto, subrequests_list, response_proto_dict):
+    def _parse_sub_responses(self, returns, subrequests_list, response_proto_dict):
         self.log.debug('Parsing sub RPC responses...')
         response_proto_dict['responses'] = {}
-        del response_proto_dict['returns']
 
         list_len = len(subrequests_list) -1
         i = 0
-        for subresponse in response_proto.returns:
+        for subresponse in returns:
             if i > list_len:
                 self.log.info("Error - something strange happend...")
             
-            request_entry = subrequests_list[i]
-            if isinstance(request_entry, int):
-                entry_id = request_entry
-            else:
-                entry_id =  list(request_entry.items())[0][0]
-                
+            entry_id = self._request_type(subrequests_list[i])
             entry_name = RequestType.Name(entry_id)
             proto_name = to_camel_case(entry_name.lower()) + 'Response'
             proto_classname = 'POGOProtos.Networking.Responses_pb2.' + proto_name
@@ -226,6 +285,22 @@ class RpcApi:
             self.log.debug("Parsing class: %s", proto_classname)
             
             subresponse_return = None
+            raw_handler = self._raw_handlers.get(entry_id)
+            if raw_handler is not None:
+                # the handler decodes the serialized sub response itself, see pgoapi.wire
+                RESPONSE_BYTES.labels(entry_name).observe(len(subresponse))
+                start = time.time()
+                try:
+                    subresponse_return = raw_handler(subresponse)
+                except Exception as e:
+                    subresponse_return = 'Raw handler for {} failed: {}'.format(entry_name, e)
+                    self.log.warning(subresponse_return)
+                else:
+                    PARSE_DURATION.labels(entry_name).observe(time.time() - start)
+                response_proto_dict['responses'][entry_name] = subresponse_return
+                i += 1
+                continue
+
             try:
                 subresponse_extension = self.get_class(proto_classname)()         
             except Exception as e:
@@ -235,15 +310,30 @@ class RpcApi:
                 self.log.debug(error)
             
             if subresponse_extension:
+                RESPONSE_BYTES.labels(entry_name).observe(len(subresponse))
                 try: 
-                    subresponse_extension.ParseFromString(subresponse)
+                    start = time.time()
+                    _parse_from(subresponse_extension, subresponse)
                     subresponse_return = protobuf_to_dict(subresponse_extension)
+                    PARSE_DURATION.labels(entry_name).observe(time.time() - start)
                 except:
                     error = "Protobuf definition for {} seems not to match".format(proto_classname)
                     subresponse_return = error
                     self.log.debug(error)
+                else:
+                    for hook in self._response_hooks.get(entry_id, []):
+                        try:
+                            hook(subresponse_extension)
+                        except Exception as e:
+                            self.log.warning('Response hook for %s failed: %s', entry_name, str(e))
             
             response_proto_dict['responses'][entry_name] = subresponse_return
             i += 1
            
         return response_proto_dict
+
+    def _request_type(self, entry):
+        # subrequests are either a RequestType or {RequestType: arguments}
+        if isinstance(entry, int):
+            return entry
+        return list(entry.items())[0][0]
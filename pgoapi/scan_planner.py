@@ -0,0 +1,106 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import math
+import heapq
+import logging
+
+from pgoapi.utilities import get_cell_id
+
+log = logging.getLogger(__name__)
+
+# meters per degree of latitude
+METERS_PER_DEGREE = 111320.0
+
+
+def _project(points):
+    # equirectangular projection around the mean latitude, good enough for city sized areas
+    mean_lat = sum(lat for lat, lng in points) / len(points)
+    scale = math.cos(math.radians(mean_lat))
+    return [(lng * METERS_PER_DEGREE * scale, lat * METERS_PER_DEGREE) for lat, lng in points]
+
+
+def _coverage(xy, radius):
+    # indices of the points within radius of every point, using a grid with radius sized buckets
+    grid = {}
+    for i, (x, y) in enumerate(xy):
+        grid.setdefault((int(math.floor(x / radius)), int(math.floor(y / radius))), []).append(i)
+
+    radius_sq = radius * radius
+    coverage = []
+    for x, y in xy:
+        bx, by = int(math.floor(x / radius)), int(math.floor(y / radius))
+        covered = []
+        for gx in (bx - 1, bx, bx + 1):
+            for gy in (by - 1, by, by + 1):
+                for j in grid.get((gx, gy), ()):
+                    ox, oy = xy[j]
+                    if (ox - x) ** 2 + (oy - y) ** 2 <= radius_sq:
+                        covered.append(j)
+        coverage.append(covered)
+    return coverage
+
+
+def plan_scan_points(points, radius=70):
+    """ greedy set cover: returns [(lat, lng, covered)] scan positions from which every point is within radius meters """
+    points = list(points)
+    if not points:
+        return []
+
+    coverage = _coverage(_project(points), radius)
+
+    # lazy greedy - a heap entry is only re-evaluated once it reaches the top
+    heap = [(-len(covered), i) for i, covered in enumerate(coverage)]
+    heapq.heapify(heap)
+    is_covered = [False] * len(points)
+    remaining = len(points)
+
+    plan = []
+    while remaining and heap:
+        neg_gain, i = heapq.heappop(heap)
+        gain = sum(1 for j in coverage[i] if not is_covered[j])
+        if gain == 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+
+        for j in coverage[i]:
+            is_covered[j] = True
+        remaining -= gain
+        plan.append((points[i][0], points[i][1], gain))
+
+    log.debug('Planned %s scan points for %s points', len(plan), len(points))
+    return plan
+
+
+def submit_plan(scheduler, plan, priority=0, kind=None, level=17):
+    # planned positions are only deduplicated against scans of the same level <level> cell (~70m),
+    # the default cells of a scan job would merge most of the plan away
+    for lat, lng, covered in plan:
+        scheduler.put(lat, lng, priority=priority, kind=kind, cell_ids=[get_cell_id(lat, lng, level)])
+    return len(plan)
@@ -0,0 +1,199 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+from six.moves.queue import Empty, Full
+
+from pgoapi.utilities import get_cell_ids, get_cell_id
+
+
+class ScanJob(object):
+
+    def __init__(self, job_id, lat, lng, kind, priority, cell_ids, origin=None):
+        self.id = job_id
+        self.lat = lat
+        self.lng = lng
+        self.kind = kind
+        self.priority = priority
+        self.cell_ids = cell_ids
+        self.origin = origin or get_cell_id(lat, lng)
+        self.submitted = time.time()
+        self.merged = 0
+
+    def __repr__(self):
+        return '<ScanJob {} ({}, {}) kind={} priority={}>'.format(self.id, self.lat, self.lng, self.kind, self.priority)
+
+
+class ScanScheduler(object):
+
+    def __init__(self, cell_radius=10, aging=60.0, maxsize=0):
+        self.log = logging.getLogger(__name__)
+
+        self._cell_radius = cell_radius
+        # queued jobs from which put raises Full, 0 for no bound
+        self._maxsize = maxsize
+        # a job waiting <aging> seconds gains one priority level
+        self._aging = float(aging)
+
+        self._cond = threading.Condition(threading.Lock())
+        self._ids = itertools.count(1)
+
+        self._heap = []
+        # job id -> job, for jobs waiting in the heap
+        self._queued = {}
+        # job id -> job, for jobs handed out to a worker
+        self._in_flight = {}
+        # (kind, cell id) -> number of queued or in flight jobs covering it
+        self._claims = {}
+        # (kind, origin cell id) -> queued job, used to merge duplicate submissions
+        self._origins = {}
+
+        self._submitted = 0
+        self._deduped = 0
+        self._rejected = 0
+
+    def put(self, lat, lng, priority=0, kind=None, cell_ids=None):
+        # returns the new job, the queued/in flight job it was merged into or
+        # None if its cells are already covered by several other jobs.
+        # cell_ids overrides the cells used for deduplication, the first one is the origin
+        if cell_ids is None:
+            origin = get_cell_id(lat, lng)
+            cell_ids = get_cell_ids(lat, lng, self._cell_radius)
+        else:
+            origin = cell_ids[0]
+
+        with self._cond:
+            self._submitted += 1
+
+            if all((kind, cell_id) in self._claims for cell_id in cell_ids):
+                self._deduped += 1
+                job = self._origins.get((kind, origin))
+                if job is not None:
+                    job.merged += 1
+                    if priority > job.priority:
+                        job.priority = priority
+                        if job.id in self._queued:
+                            self._push(job)
+                self.log.debug('Scan of (%s, %s) already covered by queued/in flight jobs', lat, lng)
+                return job
+
+            if self._maxsize and len(self._queued) >= self._maxsize:
+                self._rejected += 1
+                raise Full
+
+            job = ScanJob(next(self._ids), lat, lng, kind, priority, cell_ids, origin)
+            for cell_id in cell_ids:
+                key = (kind, cell_id)
+                self._claims[key] = self._claims.get(key, 0) + 1
+            self._origins[(kind, job.origin)] = job
+
+            self._queued[job.id] = job
+            self._push(job)
+            self._cond.notify()
+            return job
+
+    def get(self, block=True, timeout=None):
+        with self._cond:
+            if timeout is not None:
+                deadline = time.time() + timeout
+
+            while not self._queued:
+                if not block:
+                    raise Empty
+                if timeout is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise Empty
+                    self._cond.wait(remaining)
+
+            while True:
+                key, job_id, job = heapq.heappop(self._heap)
+                # stale entry of a job whose priority was raised or which was already handed out
+                if job_id in self._queued and key == self._key(job):
+                    break
+
+            del self._queued[job.id]
+            self._in_flight[job.id] = job
+            return job
+
+    def task_done(self, job):
+        with self._cond:
+            if self._in_flight.pop(job.id, None) is None:
+                return
+            self._release(job)
+
+    def retry(self, job):
+        # put an in flight job back into the queue, its cells stay claimed
+        with self._cond:
+            if self._in_flight.pop(job.id, None) is None:
+                return
+            self._queued[job.id] = job
+            self._push(job)
+            self._cond.notify()
+
+    def qsize(self):
+        with self._cond:
+            return len(self._queued)
+
+    def stats(self):
+        with self._cond:
+            now = time.time()
+            oldest = min([job.submitted for job in self._queued.values()] or [now])
+            return {
+                'queued': len(self._queued),
+                'in_flight': len(self._in_flight),
+                'submitted': self._submitted,
+                'deduped': self._deduped,
+                'rejected': self._rejected,
+                'oldest_age': now - oldest,
+            }
+
+    def _key(self, job):
+        # older jobs gain priority over time so low priority work is not starved
+        return job.submitted / self._aging - job.priority
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (self._key(job), job.id, job))
+
+    def _release(self, job):
+        for cell_id in job.cell_ids:
+            key = (job.kind, cell_id)
+            count = self._claims.get(key, 0) - 1
+            if count > 0:
+                self._claims[key] = count
+            else:
+                self._claims.pop(key, None)
+
+        if self._origins.get((job.kind, job.origin)) is job:
+            del self._origins[(job.kind, job.origin)]
@@ -0,0 +1,221 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import sys
+import time
+import bisect
+import signal
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+from six.moves.queue import Empty, Queue
+
+from pgoapi.utilities import get_cell_id
+
+
+class HashRing(object):
+
+    def __init__(self, nodes, replicas=100):
+        self._replicas = replicas
+        self._ring = []
+        self._nodes = {}
+
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        for i in range(self._replicas):
+            point = self._hash('{}-{}'.format(node, i))
+            self._nodes[point] = node
+            bisect.insort(self._ring, point)
+
+    def get_node(self, key):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._ring, self._hash(str(key))) % len(self._ring)
+        return self._nodes[self._ring[index]]
+
+    def _hash(self, value):
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def _shard_main(shard_id, accounts, worker_factory, jobs, results):
+    # entry point of a shard process: one scan thread per account, all pulling from the shard job queue
+    log = logging.getLogger(__name__)
+    log.info('Shard %s started with %s accounts', shard_id, len(accounts))
+
+    # the supervisor terminates its shards on exit, leave through SystemExit so that
+    # multiprocessing finalizers (e.g. flushing exporters) still run
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    def run(account):
+        scan = worker_factory(account)
+        while True:
+            job_id, lat, lng, kind = jobs.get()
+            try:
+                result = scan(lat, lng, kind)
+                results.put((shard_id, job_id, result, None))
+            except Exception as e:
+                results.put((shard_id, job_id, None, str(e)))
+
+    threads = []
+    for account in accounts:
+        t = threading.Thread(target=run, args=(account,))
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    for t in threads:
+        t.join()
+
+
+class ShardSupervisor(object):
+    """ runs the scan accounts in <num_shards> processes, worker_factory(account) returns the scan(lat, lng, kind) of an account """
+
+    def __init__(self, num_shards, accounts, worker_factory, region_level=10, check_interval=5.0, start_method='spawn'):
+        self.log = logging.getLogger(__name__)
+
+        # shards are restarted from the monitor thread while the front-end runs its threads, a forked
+        # process could inherit locks held by them. Spawned processes start clean, but worker_factory
+        # has to be picklable, i.e. a module level function.
+        self._context = multiprocessing.get_context(start_method)
+        self._worker_factory = worker_factory
+        # scan jobs are routed by the S2 cell of this level containing the job location
+        self._region_level = region_level
+        # seconds between checks for dead shard processes
+        self._check_interval = check_interval
+
+        account_ring = HashRing(range(num_shards))
+        self._accounts = dict((shard, []) for shard in range(num_shards))
+        for account in accounts:
+            self._accounts[account_ring.get_node(account)].append(account)
+
+        # shards without any account cannot scan, so they do not own any region
+        self._shards = [shard for shard in range(num_shards) if self._accounts[shard]]
+        self._region_ring = HashRing(self._shards)
+
+        self._lock = threading.Lock()
+        self._processes = {}
+        self._jobs = {}
+        # fed by one forwarder thread per shard process, every process writes to a queue of its own
+        self._results = Queue()
+        # job id -> (shard, job)
+        self._pending = {}
+        self._monitor = None
+
+    def start(self):
+        for shard in self._shards:
+            self._jobs[shard] = self._context.Queue()
+            self._spawn(shard)
+
+        self._monitor = threading.Thread(target=self._monitor_shards)
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    def submit(self, job):
+        shard = self.get_shard(job.lat, job.lng)
+        # under the lock, a restart of the shard swaps its queue
+        with self._lock:
+            self._pending[job.id] = (shard, job)
+            self._jobs[shard].put((job.id, job.lat, job.lng, job.kind))
+        return shard
+
+    def get_shard(self, lat, lng):
+        return self._region_ring.get_node(get_cell_id(lat, lng, self._region_level))
+
+    def get_result(self, timeout=1.0):
+        """ returns (job, result, error) of the next finished job or None after timeout """
+        try:
+            shard, job_id, result, error = self._results.get(timeout=timeout)
+        except Empty:
+            return None
+
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+        if entry is None:
+            return None
+        return entry[1], result, error
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _spawn(self, shard):
+        # a dead process may have left the lock of its result queue held or a result half written
+        results = self._context.Queue()
+        process = self._context.Process(target=_shard_main, args=(shard, self._accounts[shard], self._worker_factory, self._jobs[shard], results))
+        process.daemon = True
+        process.start()
+        self._processes[shard] = process
+
+        forwarder = threading.Thread(target=self._forward_results, args=(process, results))
+        forwarder.daemon = True
+        forwarder.start()
+
+    def _forward_results(self, process, results):
+        # until the process is gone and everything it sent was read
+        while True:
+            try:
+                self._results.put(results.get(timeout=self._check_interval))
+            except Empty:
+                if not process.is_alive():
+                    break
+            except (EOFError, OSError) as e:
+                self.log.warning('Results of a shard process lost: %s', e)
+                break
+        results.close()
+
+    def _monitor_shards(self):
+        # dead shards are noticed even while the others keep producing results
+        while True:
+            time.sleep(self._check_interval)
+            try:
+                self._check_shards()
+            except Exception as e:
+                self.log.warning('Checking the shards failed: %s', e)
+
+    def _check_shards(self):
+        for shard, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+
+            self.log.warning('Shard %s died (exit code %s) - restarting', shard, process.exitcode)
+
+            # the new process gets a fresh queue with every pending job of the shard: the ones
+            # the dead process had taken and the ones still waiting in its old queue, each once
+            with self._lock:
+                old_jobs = self._jobs[shard]
+                self._jobs[shard] = self._context.Queue()
+                for owner, job in self._pending.values():
+                    if owner == shard:
+                        self._jobs[shard].put((job.id, job.lat, job.lng, job.kind))
+            old_jobs.cancel_join_thread()
+            old_jobs.close()
+
+            self._spawn(shard)
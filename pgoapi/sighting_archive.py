@@ -0,0 +1,207 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from six.moves.queue import Queue, Empty, Full
+
+
+def to_signed64(value):
+    # encounter and cell ids are unsigned 64 bit, sqlite only stores signed 64 bit integers
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class SightingArchive(object):
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sightings (
+            encounter_id INTEGER PRIMARY KEY,
+            spawnpoint_id TEXT,
+            pokemon_id INTEGER,
+            latitude REAL,
+            longitude REAL,
+            cell_id INTEGER,
+            first_seen_ms INTEGER,
+            last_seen_ms INTEGER,
+            disappear_ms INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS sightings_spawnpoint ON sightings (spawnpoint_id, disappear_ms);
+        CREATE INDEX IF NOT EXISTS sightings_cell ON sightings (cell_id, first_seen_ms);
+        CREATE INDEX IF NOT EXISTS sightings_time ON sightings (first_seen_ms);
+
+        CREATE TABLE IF NOT EXISTS fort_snapshots (
+            fort_id TEXT,
+            last_modified_ms INTEGER,
+            cell_id INTEGER,
+            seen_ms INTEGER,
+            latitude REAL,
+            longitude REAL,
+            type INTEGER,
+            team INTEGER,
+            guard_pokemon_id INTEGER,
+            gym_points INTEGER,
+            lure_expires_ms INTEGER,
+            PRIMARY KEY (fort_id, last_modified_ms)
+        );
+        CREATE INDEX IF NOT EXISTS fort_snapshots_cell ON fort_snapshots (cell_id, seen_ms);
+        CREATE INDEX IF NOT EXISTS fort_snapshots_time ON fort_snapshots (seen_ms);
+    """
+
+    def __init__(self, path, max_pending=10000, batch_size=1000, batch_delay=1.0):
+        self.log = logging.getLogger(__name__)
+
+        self._path = path
+        self._batch_size = batch_size
+        self._batch_delay = batch_delay
+
+        # bounded, a full queue drops records instead of blocking the scanner
+        self._queue = Queue(max_pending)
+        self._lock = threading.Lock()
+        self._pid = None
+
+        self._written = 0
+        self._dropped = 0
+        self._errors = 0
+
+    def record(self, map_cells):
+        # converts the map cells into rows and hands them to the writer thread, never blocks
+        self._ensure_started()
+
+        sightings = []
+        forts = []
+        for cell in map_cells:
+            cell_id = to_signed64(cell.get('s2_cell_id'))
+            now_ms = cell.get('current_timestamp_ms') or int(time.time() * 1000)
+
+            for pokemon in cell.get('wild_pokemons', []):
+                sightings.append((
+                    to_signed64(pokemon['encounter_id']),
+                    pokemon.get('spawnpoint_id'),
+                    pokemon.get('pokemon_data', {}).get('pokemon_id'),
+                    pokemon.get('latitude'),
+                    pokemon.get('longitude'),
+                    cell_id,
+                    now_ms,
+                    now_ms,
+                    now_ms + pokemon.get('time_till_hidden_ms', 0),
+                ))
+
+            for fort in cell.get('forts', []):
+                forts.append((
+                    fort['id'],
+                    fort.get('last_modified_timestamp_ms', 0),
+                    cell_id,
+                    now_ms,
+                    fort.get('latitude'),
+                    fort.get('longitude'),
+                    fort.get('type', 0),
+                    fort.get('owned_by_team', 0),
+                    fort.get('guard_pokemon_id'),
+                    fort.get('gym_points'),
+                    fort.get('lure_info', {}).get('lure_expires_timestamp_ms'),
+                ))
+
+        if not sightings and not forts:
+            return
+        try:
+            self._queue.put_nowait((sightings, forts))
+        except Full:
+            with self._lock:
+                self._dropped += len(sightings) + len(forts)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._queue.qsize(),
+                'written': self._written,
+                'dropped': self._dropped,
+                'errors': self._errors,
+            }
+
+    def _ensure_started(self):
+        # the writer thread does not survive a fork, start one per process
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            t = threading.Thread(target=self._run)
+            t.daemon = True
+            t.start()
+            self._pid = pid
+
+    def _connect(self):
+        conn = sqlite3.connect(self._path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            sightings, forts = self._queue.get()
+
+            # collect everything arriving within batch_delay into one transaction
+            deadline = time.time() + self._batch_delay
+            while len(sightings) + len(forts) < self._batch_size:
+                try:
+                    more_sightings, more_forts = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except Empty:
+                    break
+                sightings.extend(more_sightings)
+                forts.extend(more_forts)
+
+            try:
+                self._write(conn, sightings, forts)
+            except sqlite3.Error as e:
+                self.log.warning('Could not archive %s sightings/%s forts: %s', len(sightings), len(forts), e)
+                with self._lock:
+                    self._errors += 1
+                continue
+
+            with self._lock:
+                self._written += len(sightings) + len(forts)
+
+    def _write(self, conn, sightings, forts):
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO sightings (encounter_id, spawnpoint_id, pokemon_id, latitude, longitude, '
+                'cell_id, first_seen_ms, last_seen_ms, disappear_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', sightings)
+            conn.executemany(
+                'UPDATE sightings SET last_seen_ms = MAX(last_seen_ms, ?) WHERE encounter_id = ?',
+                [(row[7], row[0]) for row in sightings])
+            conn.executemany(
+                'INSERT OR IGNORE INTO fort_snapshots (fort_id, last_modified_ms, cell_id, seen_ms, latitude, longitude, '
+                'type, team, guard_pokemon_id, gym_points, lure_expires_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', forts)
@@ -0,0 +1,239 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import math
+import time
+import logging
+import threading
+
+from six.moves.queue import Full
+
+from pgoapi.utilities import get_cell_id
+
+# spawn points repeat their spawn every hour
+PERIOD = 3600
+
+# encounter ids remembered per spawn point, there is one spawn per period
+RECENT_ENCOUNTERS = 8
+
+
+class SpawnPoint(object):
+
+    def __init__(self, spawnpoint_id, lat, lng):
+        self.id = spawnpoint_id
+        self.lat = lat
+        self.lng = lng
+        self.observations = 0
+        # sums of the unit vectors of the despawn phases, for the circular mean
+        self._sin = 0.0
+        self._cos = 0.0
+        # despawn time of the window which was last handed out as scan
+        self.last_emitted = 0
+        self._encounters = []
+
+    def observe(self, disappear_s, encounter_id=None):
+        # every encounter counts once, however often it is seen
+        if encounter_id is not None:
+            if encounter_id in self._encounters:
+                return False
+            self._encounters.append(encounter_id)
+            del self._encounters[:-RECENT_ENCOUNTERS]
+
+        angle = 2 * math.pi * (disappear_s % PERIOD) / PERIOD
+        self._sin += math.sin(angle)
+        self._cos += math.cos(angle)
+        self.observations += 1
+        return True
+
+    def despawn_phase(self):
+        # mean despawn second within the hour
+        angle = math.atan2(self._sin, self._cos)
+        return (angle / (2 * math.pi) * PERIOD) % PERIOD
+
+    def spread(self):
+        # circular standard deviation of the despawn phase in seconds
+        if not self.observations:
+            return float(PERIOD)
+        r = math.hypot(self._sin, self._cos) / self.observations
+        if r <= 0:
+            return float(PERIOD)
+        return math.sqrt(-2 * math.log(min(r, 1.0))) / (2 * math.pi) * PERIOD
+
+    def next_despawn(self, now_s):
+        # first predicted despawn at or after now
+        phase = self.despawn_phase()
+        despawn = now_s - (now_s % PERIOD) + phase
+        if despawn < now_s:
+            despawn += PERIOD
+        return despawn
+
+
+class SpawnLearner(object):
+
+    def __init__(self, spawn_duration=900, max_spread=120, min_observations=2):
+        self.log = logging.getLogger(__name__)
+
+        # seconds a pokemon is visible before it despawns
+        self._spawn_duration = spawn_duration
+        # spawn points whose despawn time scatters more than this are not predicted
+        self._max_spread = max_spread
+        # distinct encounters needed before the spread means anything
+        self._min_observations = min_observations
+
+        self._lock = threading.Lock()
+        self._spawns = {}
+
+    def observe(self, spawnpoint_id, lat, lng, disappear_ms, encounter_id=None):
+        with self._lock:
+            self._observe(spawnpoint_id, lat, lng, disappear_ms, encounter_id)
+
+    def observe_map_cells(self, map_cells):
+        with self._lock:
+            for cell in map_cells:
+                now_ms = cell.get('current_timestamp_ms') or int(time.time() * 1000)
+                for pokemon in cell.get('wild_pokemons', []):
+                    self._observe_pokemon(pokemon, now_ms)
+
+    def observe_pokemon(self, pokemon, now_ms=None):
+        with self._lock:
+            self._observe_pokemon(pokemon, now_ms or int(time.time() * 1000))
+
+    def spawn_points(self):
+        with self._lock:
+            return [(spawn.id, spawn.lat, spawn.lng) for spawn in self._spawns.values()]
+
+    def active_spawns(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            return [spawn for spawn in self._predictable() if self._window(spawn, now)[0] <= now]
+
+    def due_scans(self, now=None):
+        """ returns one (lat, lng) per level 15 cell containing spawns which became active since they were last scanned """
+        scans = self.plan_scans(now)
+        for lat, lng, windows in scans:
+            self.mark_emitted(windows)
+        return [(lat, lng) for lat, lng, windows in scans]
+
+    def plan_scans(self, now=None):
+        """ like due_scans, but returns (lat, lng, windows) and leaves marking the windows to mark_emitted """
+        now = now or time.time()
+        cells = {}
+        with self._lock:
+            for spawn in self._predictable():
+                appear, despawn = self._window(spawn, now)
+                if appear > now or spawn.last_emitted >= despawn:
+                    continue
+                cells.setdefault(get_cell_id(spawn.lat, spawn.lng), []).append((spawn, despawn))
+
+        scans = []
+        for windows in cells.values():
+            lat = sum(spawn.lat for spawn, despawn in windows) / len(windows)
+            lng = sum(spawn.lng for spawn, despawn in windows) / len(windows)
+            scans.append((lat, lng, [(spawn.id, despawn) for spawn, despawn in windows]))
+        return scans
+
+    def mark_emitted(self, windows):
+        # (spawnpoint id, despawn) of windows which were queued as scan
+        with self._lock:
+            for spawnpoint_id, despawn in windows:
+                spawn = self._spawns.get(spawnpoint_id)
+                if spawn is not None:
+                    spawn.last_emitted = max(spawn.last_emitted, despawn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'spawn_points': len(self._spawns),
+                'predictable': len(list(self._predictable())),
+            }
+
+    def _observe_pokemon(self, pokemon, now_ms):
+        time_till_hidden = pokemon.get('time_till_hidden_ms', 0)
+        # values outside one period are placeholders of the server, not despawn times
+        if not pokemon.get('spawnpoint_id') or not 0 < time_till_hidden <= PERIOD * 1000:
+            return
+        self._observe(pokemon['spawnpoint_id'], pokemon['latitude'], pokemon['longitude'], now_ms + time_till_hidden,
+                      pokemon.get('encounter_id'))
+
+    def _observe(self, spawnpoint_id, lat, lng, disappear_ms, encounter_id=None):
+        spawn = self._spawns.get(spawnpoint_id)
+        if spawn is None:
+            spawn = self._spawns[spawnpoint_id] = SpawnPoint(spawnpoint_id, lat, lng)
+        spawn.observe(disappear_ms / 1000.0, encounter_id)
+
+    def _predictable(self):
+        for spawn in self._spawns.values():
+            if spawn.observations >= self._min_observations and spawn.spread() <= self._max_spread:
+                yield spawn
+
+    def _window(self, spawn, now):
+        # (appear, despawn) of the current or next spawn
+        despawn = spawn.next_despawn(now)
+        return despawn - self._spawn_duration, despawn
+
+
+class SpawnScanFeeder(object):
+
+    def __init__(self, learner, scheduler, interval=10, priority=0, kind=None):
+        self.log = logging.getLogger(__name__)
+
+        self._learner = learner
+        self._scheduler = scheduler
+        self._interval = interval
+        self._priority = priority
+        self._kind = kind
+
+    def start(self):
+        t = threading.Thread(target=self._run)
+        t.daemon = True
+        t.start()
+        return self
+
+    def feed(self, now=None):
+        # windows are only marked once their scan is queued, a full scheduler leaves them for the next round
+        queued = full = 0
+        for lat, lng, windows in self._learner.plan_scans(now):
+            try:
+                self._scheduler.put(lat, lng, priority=self._priority, kind=self._kind)
+            except Full:
+                full += 1
+                continue
+            self._learner.mark_emitted(windows)
+            queued += 1
+        if queued:
+            self.log.debug('Queued %s predicted spawn scans', queued)
+        if full:
+            self.log.info('Scheduler full, %s predicted spawn scans postponed', full)
+        return queued
+
+    def _run(self):
+        while True:
+            try:
+                self.feed()
+            except Exception as e:
+                self.log.warning('Feeding predicted spawn scans failed: %s', str(e))
+            time.sleep(self._interval)
@@ -24,8 +24,11 @@ Author: tjado <https://github.com/tejado>
 """
 
 import struct
+import random
 import re
 
+from s2sphere import CellId, LatLng
+
 def f2i(float):
   return struct.unpack('<Q', struct.pack('<d', float))[0]
 
@@ -43,5 +46,47 @@ def to_camel_case(value):
   c = camelcase()
   return "".join(next(c)(x) if x else '_' for x in value.split("_"))
 
+def get_cell_ids(lat, long, radius = 10):
+  origin = CellId.from_lat_lng(LatLng.from_degrees(lat, long)).parent(15)
+  walk = [origin.id()]
+  right = origin.next()
+  left = origin.prev()
+
+  # Search around provided radius
+  for i in range(radius):
+    walk.append(right.id())
+    walk.append(left.id())
+    right = right.next()
+    left = left.prev()
+
+  return sorted(walk)
+
+def get_cell_id(lat, long, level = 15):
+  return CellId.from_lat_lng(LatLng.from_degrees(lat, long)).parent(level).id()
+
+def generate_spiral(starting_lat, starting_lng, step_size, step_limit):
+  # square spiral of step_limit steps, every step is jittered and listed twice
+  coords = [{'lat': starting_lat, 'lng': starting_lng}]
+  steps,x,y,d,m = 1, 0, 0, 1, 1
+  rlow = 0.0
+  rhigh = 0.0005
+
+  while steps < step_limit:
+    while 2 * x * d < m and steps < step_limit:
+      x = x + d
+      steps += 1
+      lat = x * step_size + starting_lat + random.uniform(rlow, rhigh)
+      lng = y * step_size + starting_lng + random.uniform(rlow, rhigh)
+      coords.append({'lat': lat, 'lng': lng})
+      coords.append({'lat': lat, 'lng': lng})
+    while 2 * y * d < m and steps < step_limit:
+      y = y + d
+      steps += 1
+      lat = x * step_size + starting_lat + random.uniform(rlow, rhigh)
+      lng = y * step_size + starting_lng + random.uniform(rlow, rhigh)
+      coords.append({'lat': lat, 'lng': lng})
+      coords.append({'lat': lat, 'lng': lng})
 
-            
\ No newline at end of file
+    d = -1 * d
+    m = m + 1
+  return coords
@@ -0,0 +1,252 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+# Wire level reader of GetMapObjectsResponse for pure sighting collection.
+# Only the wild pokemon are decoded, every other field (forts, spawn points,
+# nearby pokemon, ...) is skipped by its length prefix without being parsed.
+#
+#   GetMapObjectsResponse  map_cells = 1, status = 2
+#   MapCell                s2_cell_id = 1, current_timestamp_ms = 2, wild_pokemons = 5
+#   WildPokemon            encounter_id = 1 (fixed64), latitude = 3, longitude = 4 (double),
+#                          spawnpoint_id = 5, pokemon_data = 7, time_till_hidden_ms = 11
+#   PokemonData            pokemon_id = 2
+
+from __future__ import absolute_import
+
+import time
+import struct
+
+import six
+
+from pgoapi.records import WildPokemon
+
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+_double = struct.Struct('<d')
+_fixed64 = struct.Struct('<Q')
+
+
+class WireError(ValueError):
+    pass
+
+
+def _buffer(data):
+    # indexing bytes gives ints on python 3 only
+    if six.PY2 and not isinstance(data, bytearray):
+        return bytearray(data)
+    return data
+
+
+def _varint(buf, pos):
+    try:
+        value = buf[pos]
+        pos += 1
+        if value < 0x80:
+            return value, pos
+        value &= 0x7f
+        shift = 7
+        while True:
+            byte = buf[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+            if shift >= 70:
+                raise WireError('Varint too long at {}'.format(pos))
+    except IndexError:
+        raise WireError('Truncated varint at {}'.format(pos))
+
+
+def _int64(value):
+    # negative int32/int64 values are encoded as 10 byte two's complement varints
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _skip(buf, pos, wire_type):
+    if wire_type == VARINT:
+        return _varint(buf, pos)[1]
+    if wire_type == FIXED64:
+        return pos + 8
+    if wire_type == LENGTH_DELIMITED:
+        length, pos = _varint(buf, pos)
+        return pos + length
+    if wire_type == FIXED32:
+        return pos + 4
+    raise WireError('Unsupported wire type {} at {}'.format(wire_type, pos))
+
+
+def _pokemon_id(buf, pos, end):
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key == 0x10:
+            return _varint(buf, pos)[0]
+        pos = _skip(buf, pos, key & 7)
+    return 0
+
+
+def _wild_pokemon(buf, pos, end):
+    encounter_id = pokemon_id = time_till_hidden_ms = 0
+    latitude = longitude = 0.0
+    spawnpoint_id = b''
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key == 0x09:
+            encounter_id = _fixed64.unpack_from(buf, pos)[0]
+            pos += 8
+        elif key == 0x19:
+            latitude = _double.unpack_from(buf, pos)[0]
+            pos += 8
+        elif key == 0x21:
+            longitude = _double.unpack_from(buf, pos)[0]
+            pos += 8
+        elif key == 0x2a:
+            length, pos = _varint(buf, pos)
+            spawnpoint_id = bytes(buf[pos:pos + length])
+            pos += length
+        elif key == 0x3a:
+            length, pos = _varint(buf, pos)
+            pokemon_id = _pokemon_id(buf, pos, pos + length)
+            pos += length
+        elif key == 0x58:
+            value, pos = _varint(buf, pos)
+            time_till_hidden_ms = _int64(value)
+        else:
+            pos = _skip(buf, pos, key & 7)
+    if pos != end:
+        raise WireError('WildPokemon overruns its length at {}'.format(pos))
+    return encounter_id, spawnpoint_id, pokemon_id, latitude, longitude, time_till_hidden_ms
+
+
+def iter_wild_pokemons(data):
+    """ yields (cell_id, current_timestamp_ms, encounter_id, spawnpoint_id, pokemon_id, latitude, longitude, time_till_hidden_ms) """
+    buf = _buffer(data)
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key != 0x0a:
+            pos = _skip(buf, pos, key & 7)
+            continue
+
+        length, pos = _varint(buf, pos)
+        cell_end = pos + length
+        if cell_end > end:
+            raise WireError('MapCell overruns the response at {}'.format(pos))
+        cell_id = now_ms = 0
+        pokemons = []
+        while pos < cell_end:
+            key, pos = _varint(buf, pos)
+            if key == 0x08:
+                cell_id, pos = _varint(buf, pos)
+            elif key == 0x10:
+                now_ms, pos = _varint(buf, pos)
+            elif key == 0x2a:
+                length, pos = _varint(buf, pos)
+                if pos + length > cell_end:
+                    raise WireError('WildPokemon overruns its MapCell at {}'.format(pos))
+                pokemons.append(_wild_pokemon(buf, pos, pos + length))
+                pos += length
+            else:
+                pos = _skip(buf, pos, key & 7)
+        # the cell fields may follow its pokemon, they are only known at the end of the cell
+        for pokemon in pokemons:
+            yield (cell_id, now_ms) + pokemon
+
+
+def split_envelope(data):
+    """ splits a serialized ResponseEnvelope into (envelope without returns, [returns]), the returns are slices of data """
+    buf = _buffer(data)
+    view = memoryview(buf)
+    pos, end = 0, len(buf)
+    returns = []
+    header = []
+    start = 0
+    while pos < end:
+        field_start = pos
+        key, pos = _varint(buf, pos)
+        if key == 0x322:
+            length, pos = _varint(buf, pos)
+            if pos + length > end:
+                raise WireError('Response overruns the envelope at {}'.format(pos))
+            returns.append(view[pos:pos + length])
+            pos += length
+            if start < field_start:
+                header.append(view[start:field_start])
+            start = pos
+        else:
+            pos = _skip(buf, pos, key & 7)
+    if pos != end:
+        raise WireError('Field overruns the envelope at {}'.format(end))
+    if start < end:
+        header.append(view[start:end])
+    return b''.join(bytes(part) for part in header), returns
+
+
+def get_status(data):
+    """ GetMapObjectsResponse.status, 0 if unset """
+    buf = _buffer(data)
+    pos, end = 0, len(buf)
+    status = 0
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key == 0x10:
+            status, pos = _varint(buf, pos)
+        else:
+            pos = _skip(buf, pos, key & 7)
+    return status
+
+
+def wild_pokemons(data, now_ms=None):
+    """ the wild pokemon of a serialized GetMapObjectsResponse as records.WildPokemon """
+    # disappear times count from the server time of the cell, now_ms only stands in for cells without one
+    now_ms = now_ms or int(time.time() * 1000)
+    return [WildPokemon(encounter_id, spawnpoint_id.decode('utf-8'), pokemon_id, latitude, longitude,
+                        (cell_now_ms or now_ms) + time_till_hidden_ms)
+            for (cell_id, cell_now_ms, encounter_id, spawnpoint_id, pokemon_id, latitude, longitude,
+                 time_till_hidden_ms) in iter_wild_pokemons(data)]
+
+
+def _spawnpoint_to_int(spawnpoint_id):
+    try:
+        return int(spawnpoint_id, 16) if spawnpoint_id else 0
+    except ValueError:
+        return 0
+
+
+def wild_pokemon_array(data):
+    """ the wild pokemon of a serialized GetMapObjectsResponse as columnar.sighting_dtype() array """
+    # imported here, rpc_api uses this module and numpy would slow down "import pgoapi"
+    from pgoapi.columnar import np, sighting_dtype
+
+    # raises ImportError without numpy
+    dtype = sighting_dtype()
+    rows = [(encounter_id, pokemon_id, latitude, longitude, _spawnpoint_to_int(spawnpoint_id), cell_id,
+             now_ms, now_ms + time_till_hidden_ms)
+            for (cell_id, now_ms, encounter_id, spawnpoint_id, pokemon_id, latitude, longitude,
+                 time_till_hidden_ms) in iter_wild_pokemons(data)]
+    return np.array(rows, dtype=dtype)
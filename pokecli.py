@@ -35,18 +35,82 @@ import logging
 import requests
 import argparse
 import getpass
+from contextlib import contextmanager
+
+
+class StartupProfile(object):
+    # wall time of the startup phases and peak RSS, printed as JSON with --profile-startup.
+    # --profile-memory adds the tracemalloc peak, but tracing slows the phases down several-fold
+    # and unevenly, so its timings are marked and must not be compared with untraced runs
+
+    def __init__(self, enabled, trace_memory=False):
+        self.enabled = enabled or trace_memory
+        self.started = time.time()
+        self.phases = []
+        self._tracemalloc = None
+        if trace_memory:
+            try:
+                import tracemalloc
+                tracemalloc.start()
+                self._tracemalloc = tracemalloc
+            except ImportError:
+                # python 2, only the peak RSS is reported
+                pass
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - start))
+
+    def add(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    def report(self):
+        report = {
+            "phases": dict((name, round(seconds, 6)) for name, seconds in self.phases),
+            "order": [name for name, seconds in self.phases],
+            "total": round(time.time() - self.started, 6),
+            # parse times depend on it several-fold
+            "protobuf_backend": get_backend(),
+        }
+        report["timings_traced"] = self._tracemalloc is not None
+        if self._tracemalloc:
+            report["peak_traced_bytes"] = self._tracemalloc.get_traced_memory()[1]
+        try:
+            import resource
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # kilobytes on linux, bytes on os x
+            report["peak_rss_bytes"] = maxrss if sys.platform == "darwin" else maxrss * 1024
+        except ImportError:
+            pass
+        return report
+
+# checked before argparse runs, the imports below are part of the profile
+profile = StartupProfile("--profile-startup" in sys.argv, "--profile-memory" in sys.argv)
 
 # add directory of this file to PATH, so that the package will be found
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
+with profile.phase("import_protobuf"):
+    import google.protobuf
+
 # import Pokemon Go API lib
-from pgoapi import pgoapi
-from pgoapi import utilities as util
+with profile.phase("import_pgoapi"):
+    from pgoapi import pgoapi
+    from pgoapi import utilities as util
+    from pgoapi.protobuf_backend import get_backend
+    from pgoapi import PROTOBUF_CHECK_SECONDS
+# measured by pgoapi/__init__.py, part of import_pgoapi
+profile.add("protobuf_version_check", PROTOBUF_CHECK_SECONDS)
 
 # other stuff
-from google.protobuf.internal import encoder
-from geopy.geocoders import GoogleV3
-from s2sphere import Cell, CellId, LatLng
+with profile.phase("import_other"):
+    from google.protobuf.internal import encoder
+    from geopy.geocoders import GoogleV3
+    from s2sphere import Cell, CellId, LatLng
 
 
 log = logging.getLogger(__name__)
@@ -100,6 +164,8 @@ def init_config():
     parser.add_argument("-l", "--location", help="Location", required=required("location"))
     parser.add_argument("-d", "--debug", help="Debug Mode", action='store_true')
     parser.add_argument("-t", "--test", help="Only parse the specified location", action='store_true')
+    parser.add_argument("--profile-startup", help="Print the time of every startup phase and the peak memory as JSON", action='store_true')
+    parser.add_argument("--profile-memory", help="Like --profile-startup with the tracemalloc peak, the timings are slowed down by tracing", action='store_true')
     parser.set_defaults(DEBUG=False, TEST=False)
     config = parser.parse_args()
 
@@ -120,6 +186,13 @@ def init_config():
     
 
 def main():
+    try:
+        run()
+    finally:
+        if profile.enabled:
+            print(json.dumps(profile.report(), indent=2, sort_keys=True))
+
+def run():
     # log settings
     # log format
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(module)10s] [%(levelname)5s] %(message)s')
@@ -139,17 +212,29 @@ def main():
         logging.getLogger("pgoapi").setLevel(logging.DEBUG)
         logging.getLogger("rpc_api").setLevel(logging.DEBUG)
     
-    position = get_pos_by_name(config.location)
+    with profile.phase("geocoding"):
+        position = get_pos_by_name(config.location)
     if config.test:
         return
     
+    if profile.enabled:
+        # generated modules are loaded lazily, otherwise they would count into the login
+        with profile.phase("import_protos"):
+            from pgoapi.protos import get_class
+            get_class('POGOProtos.Networking.Envelopes_pb2.RequestEnvelope')
+            get_class('POGOProtos.Networking.Requests.Messages_pb2.GetMapObjectsMessage')
+            get_class('POGOProtos.Networking.Responses_pb2.GetMapObjectsResponse')
+
     # instantiate pgoapi 
     api = pgoapi.PGoApi()
     
     # provide player position on the earth
     api.set_position(*position)
     
-    if not api.login(config.auth_service, config.username, config.password):
+    logged_in = api.login(config.auth_service, config.username, config.password)
+    for name, seconds in api.get_login_timings():
+        profile.add(name, seconds)
+    if not logged_in:
         return
 
     # chain subrequests (methods) into one RPC call
@@ -185,7 +270,11 @@ def main():
     #api.download_settings(hash="05daf51635c82611d1aac95c0b051d3ec088a930")
     
     # execute the RPC call
-    response_dict = api.call()
+    with profile.phase("first_rpc"):
+        response_dict = api.call()
+    if profile.enabled:
+        # stdout is reserved for the JSON report
+        return
     print('Response dictionary: \n\r{}'.format(pprint.PrettyPrinter(indent=4).pformat(response_dict)))
     
     # alternative:
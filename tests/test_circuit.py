@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+
+import pytest
+
+from pgoapi import circuit
+from pgoapi.circuit import CircuitBreaker, EndpointHealth, CLOSED, HALF_OPEN, OPEN
+from pgoapi.concurrency import SUCCESS, BUSY, ERROR, IGNORE
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit, 'time', clock)
+    return clock
+
+
+def trip(breaker, failures=3):
+    for i in range(failures):
+        breaker.record(ERROR, breaker.allow())
+    assert breaker.state() == OPEN
+
+
+def test_trips_after_consecutive_failures(clock):
+    breaker = CircuitBreaker('a', failure_threshold=3)
+    breaker.record(ERROR, breaker.allow())
+    breaker.record(BUSY, breaker.allow())
+    assert breaker.state() == CLOSED
+    breaker.record(ERROR, breaker.allow())
+    assert breaker.state() == OPEN
+    assert breaker.allow() is None
+    assert breaker.retry_after() == 30.0
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker('b', failure_threshold=3, min_calls=100)
+    for i in range(5):
+        breaker.record(ERROR, breaker.allow())
+        breaker.record(ERROR, breaker.allow())
+        breaker.record(SUCCESS, breaker.allow())
+    assert breaker.state() == CLOSED
+
+
+def test_trips_on_failure_rate(clock):
+    breaker = CircuitBreaker('c', failure_threshold=100, failure_rate=0.5, window=10, min_calls=10)
+    for i in range(9):
+        breaker.record(SUCCESS if i % 2 else ERROR, breaker.allow())
+    assert breaker.state() == CLOSED
+    breaker.record(ERROR, breaker.allow())
+    assert breaker.state() == OPEN
+
+
+def test_probe_closes_after_reset_timeout(clock):
+    breaker = CircuitBreaker('d', failure_threshold=3, reset_timeout=30.0)
+    trip(breaker)
+    clock.now += 29.0
+    assert breaker.allow() is None
+
+    clock.now += 1.0
+    probe = breaker.allow()
+    assert probe is not None and probe.probe
+    assert breaker.state() == HALF_OPEN
+    # only one probe at a time
+    assert breaker.allow() is None
+
+    breaker.record(SUCCESS, probe)
+    assert breaker.state() == CLOSED
+    assert breaker.allow() is not None
+
+
+def test_failed_probe_doubles_the_timeout(clock):
+    breaker = CircuitBreaker('e', failure_threshold=3, reset_timeout=30.0, max_reset_timeout=100.0)
+    trip(breaker)
+    for timeout in (60.0, 100.0, 100.0):
+        clock.now += breaker.retry_after()
+        breaker.record(BUSY, breaker.allow())
+        assert breaker.state() == OPEN
+        assert breaker.retry_after() == timeout
+
+    clock.now += breaker.retry_after()
+    breaker.record(SUCCESS, breaker.allow())
+    assert breaker.state() == CLOSED
+    trip(breaker)
+    assert breaker.retry_after() == 30.0
+
+
+def test_ignored_probe_frees_its_slot(clock):
+    breaker = CircuitBreaker('f', failure_threshold=3)
+    trip(breaker)
+    clock.now += breaker.retry_after()
+    breaker.record(IGNORE, breaker.allow())
+    assert breaker.state() == HALF_OPEN
+    assert breaker.allow() is not None
+
+
+def test_call_from_before_the_trip_is_not_the_probe(clock):
+    breaker = CircuitBreaker('g', failure_threshold=3)
+    slow = breaker.allow()
+    trip(breaker)
+    clock.now += breaker.retry_after()
+    probe = breaker.allow()
+
+    # the slow call answers while the probe is still out
+    breaker.record(SUCCESS, slow)
+    assert breaker.state() == HALF_OPEN
+    breaker.record(ERROR, slow)
+    assert breaker.state() == HALF_OPEN
+
+    breaker.record(SUCCESS, probe)
+    assert breaker.state() == CLOSED
+
+
+def test_probe_of_an_earlier_half_open_period(clock):
+    breaker = CircuitBreaker('h', failure_threshold=3, half_open_probes=2)
+    trip(breaker)
+    clock.now += breaker.retry_after()
+    first, second = breaker.allow(), breaker.allow()
+    breaker.record(ERROR, first)
+    assert breaker.state() == OPEN
+
+    clock.now += breaker.retry_after()
+    probe = breaker.allow()
+    breaker.record(SUCCESS, second)
+    assert breaker.state() == HALF_OPEN
+    breaker.record(SUCCESS, probe)
+    assert breaker.state() == CLOSED
+
+
+def test_endpoint_health_keeps_one_breaker_per_endpoint(clock):
+    health = EndpointHealth(failure_threshold=1)
+    health.record('a', ERROR, health.allow('a'))
+    assert health.allow('a') is None
+    assert health.allow('b') is not None
+    assert health.retry_after('a') == 30.0
+    assert sorted(health.stats()) == ['a', 'b']
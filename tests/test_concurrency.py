@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+
+import pytest
+
+from pgoapi import concurrency
+from pgoapi.concurrency import AimdLimiter, ConcurrencyController, SUCCESS, BUSY, ERROR, IGNORE
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(concurrency, 'time', clock)
+    return clock
+
+
+def fill(limiter):
+    # acquires every free slot of the limiter
+    acquired = 0
+    while limiter.acquire(timeout=0):
+        acquired += 1
+    return acquired
+
+
+def test_saturated_successes_raise_the_limit(clock):
+    limiter = AimdLimiter(initial=1, maximum=8)
+    assert fill(limiter) == 1
+    limiter.release(SUCCESS)
+    assert limiter.limit() == 2
+
+    # about one more slot after <limit> successes at the limit
+    rounds = 0
+    while limiter.limit() == 2:
+        in_flight = fill(limiter)
+        limiter.release(SUCCESS)
+        # the other RPCs finish below the limit, they do not raise it
+        limiter.release(SUCCESS)
+        for i in range(in_flight - 2):
+            limiter.release(IGNORE)
+        rounds += 1
+    assert rounds == 3
+    assert limiter.limit() == 3
+
+
+def test_unsaturated_successes_keep_the_limit(clock):
+    limiter = AimdLimiter(initial=4, maximum=8)
+    for i in range(20):
+        assert limiter.acquire(timeout=0)
+        limiter.release(SUCCESS)
+    assert limiter.limit() == 4
+
+
+def test_limit_stays_below_maximum(clock):
+    limiter = AimdLimiter(initial=1, maximum=3)
+    for i in range(20):
+        for j in range(fill(limiter)):
+            limiter.release(SUCCESS)
+    assert limiter.limit() == 3
+
+
+def test_congestion_halves_the_limit_down_to_minimum(clock):
+    limiter = AimdLimiter(initial=8, minimum=2)
+    for limit in (4, 2, 2):
+        limiter.acquire(timeout=0)
+        limiter.release(BUSY, latency=0.5)
+        assert limiter.limit() == limit
+        clock.now += 1.0
+
+
+def test_one_decrease_per_round_trip(clock):
+    limiter = AimdLimiter(initial=8)
+    assert fill(limiter) == 8
+    # RPCs which were in flight together all see the same congestion
+    limiter.release(ERROR, latency=0.5)
+    clock.now += 0.2
+    limiter.release(ERROR, latency=0.5)
+    limiter.release(BUSY, latency=0.5)
+    assert limiter.limit() == 4
+
+    clock.now += 0.5
+    limiter.release(BUSY, latency=0.5)
+    assert limiter.limit() == 2
+    assert limiter.stats()['congestions'] == 4
+
+
+def test_inflated_latency_counts_as_congestion(clock):
+    limiter = AimdLimiter(initial=4, latency_factor=2.0)
+    for i in range(5):
+        limiter.acquire(timeout=0)
+        limiter.release(SUCCESS, latency=0.1)
+    assert limiter.stats()['baseline_latency'] == pytest.approx(0.1)
+
+    limiter.acquire(timeout=0)
+    limiter.release(SUCCESS, latency=0.15)
+    assert limiter.limit() == 4
+    limiter.acquire(timeout=0)
+    limiter.release(SUCCESS, latency=0.5)
+    assert limiter.limit() == 2
+
+
+def test_ignored_outcome_only_frees_the_slot(clock):
+    limiter = AimdLimiter(initial=1)
+    assert fill(limiter) == 1
+    limiter.release(IGNORE)
+    assert limiter.limit() == 1
+    assert limiter.stats()['in_flight'] == 0
+    assert limiter.stats()['successes'] == 0
+
+
+def test_controller_takes_endpoint_and_account_slots(clock):
+    controller = ConcurrencyController(endpoint_limits=(2, 1, 4), account_limits=(1, 1, 2))
+    slots = controller.acquire('https://a/rpc', 'alice', timeout=0)
+    assert slots
+    # alice has one slot only, bob shares the endpoint
+    assert not controller.acquire('https://a/rpc', 'alice', timeout=0)
+    other = controller.acquire('https://a/rpc', 'bob', timeout=0)
+    assert other
+    assert not controller.acquire('https://a/rpc', 'carol', timeout=0)
+
+    controller.release(slots, SUCCESS, 0.1)
+    controller.release(other, SUCCESS, 0.1)
+    assert controller.acquire('https://a/rpc', 'carol', timeout=0)
@@ -0,0 +1,47 @@
+from __future__ import absolute_import
+
+import requests
+
+from pgoapi.dedupe import EncounterDeduper
+from pgoapi.map_push import MapPusher
+
+
+class FailingSession(object):
+
+    headers = {}
+
+    def post(self, url, json=None):
+        raise requests.exceptions.ConnectionError('down')
+
+
+def test_seen_within_window():
+    encounters = EncounterDeduper()
+    assert not encounters.seen(1)
+    assert encounters.seen(1)
+    assert encounters.filter([{'encounter_id': 1}, {'encounter_id': 2}]) == [{'encounter_id': 2}]
+    assert encounters.stats()['duplicates'] == 2
+
+
+def test_forget():
+    encounters = EncounterDeduper()
+    encounters.seen(1)
+    encounters.seen(2)
+    encounters.forget([1, 3])
+    assert not encounters.seen(1)
+    assert encounters.seen(2)
+
+
+def test_failed_push_forgets_the_encounters():
+    encounters = EncounterDeduper()
+    pusher = MapPusher('http://localhost/push', 'token', encounters=encounters)
+    pusher._session = FailingSession()
+    assert not encounters.seen(7)
+    assert not encounters.seen(8)
+    pusher.submit([{'type': 'pokemon', 'uid': 7, 'properties': {}},
+                   {'type': 'fort', 'uid': 8, 'properties': {}}])
+    pusher.flush()
+
+    # the next scan converts and pushes the pokemon again
+    assert not encounters.seen(7)
+    assert encounters.seen(8)
+    assert pusher.stats()['errors'] == 1
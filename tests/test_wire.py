@@ -0,0 +1,132 @@
+from __future__ import absolute_import
+
+import pytest
+
+from google.protobuf.internal.encoder import _VarintBytes
+
+from pgoapi import wire
+from pgoapi.protos import get_class
+from pgoapi.protobuf_to_dict import protobuf_to_dict
+from pgoapi.records import WildPokemon
+
+GetMapObjectsResponse = 'POGOProtos.Networking.Responses_pb2.GetMapObjectsResponse'
+MapCell = 'POGOProtos.Map_pb2.MapCell'
+ResponseEnvelope = 'POGOProtos.Networking.Envelopes_pb2.ResponseEnvelope'
+
+
+def make_response(cells=3, pokemons=4):
+    response = get_class(GetMapObjectsResponse)()
+    response.status = 1
+    for c in range(cells):
+        cell = response.map_cells.add()
+        cell.s2_cell_id = 9937309294603010048 + c * 2 ** 31
+        cell.current_timestamp_ms = 1470000000000 + c * 1000
+        fort = cell.forts.add()
+        fort.id = 'fort-%s' % c
+        fort.latitude = 40.0
+        fort.longitude = -73.0
+        spawn_point = cell.spawn_points.add()
+        spawn_point.latitude = 40.001
+        for p in range(pokemons):
+            pokemon = cell.wild_pokemons.add()
+            pokemon.encounter_id = 2 ** 63 + c * 100 + p
+            pokemon.last_modified_timestamp_ms = 1469999000000 + p
+            pokemon.latitude = 40.0 + p / 1000.0
+            pokemon.longitude = -73.0 - c / 1000.0
+            pokemon.spawnpoint_id = '89c25%x' % (c * 16 + p)
+            pokemon.pokemon_data.pokemon_id = 1 + c * pokemons + p
+            pokemon.pokemon_data.cp = 300
+            # negative once the pokemon is past its despawn time
+            pokemon.time_till_hidden_ms = 900000 - 300000 * p
+    return response
+
+
+def expected_pokemons(payload):
+    # the protobuf runtime parse of the same payload
+    response = get_class(GetMapObjectsResponse)()
+    response.ParseFromString(payload)
+    return [WildPokemon.from_dict(pokemon, cell.get('current_timestamp_ms'))
+            for cell in protobuf_to_dict(response).get('map_cells', [])
+            for pokemon in cell.get('wild_pokemons', [])]
+
+
+def fields(pokemons):
+    return [(p.encounter_id, p.spawnpoint_id, p.pokemon_id, p.latitude, p.longitude, p.disappear_ms) for p in pokemons]
+
+
+def test_wild_pokemons_match_parse_from_string():
+    payload = make_response().SerializeToString()
+    expected = expected_pokemons(payload)
+    assert len(expected) == 12
+    assert fields(wire.wild_pokemons(payload)) == fields(expected)
+
+
+def test_wild_pokemons_count_from_the_cell_timestamp():
+    payload = make_response(cells=2, pokemons=1).SerializeToString()
+    pokemons = wire.wild_pokemons(payload, now_ms=1)
+    assert [p.disappear_ms for p in pokemons] == [1470000000000 + 900000, 1470000001000 + 900000]
+
+
+def test_wild_pokemons_fall_back_to_now_without_cell_timestamp():
+    response = make_response(cells=1, pokemons=1)
+    response.map_cells[0].ClearField('current_timestamp_ms')
+    pokemons = wire.wild_pokemons(response.SerializeToString(), now_ms=1000)
+    assert pokemons[0].disappear_ms == 1000 + 900000
+
+
+def test_cell_fields_after_pokemons():
+    # fields may come in any order, a cell split in two parts parses like the merged message
+    cell = make_response(cells=1).map_cells[0]
+    pokemons_part = get_class(MapCell)()
+    pokemons_part.wild_pokemons.extend(cell.wild_pokemons)
+    header_part = get_class(MapCell)()
+    header_part.s2_cell_id = cell.s2_cell_id
+    header_part.current_timestamp_ms = cell.current_timestamp_ms
+    cell_bytes = pokemons_part.SerializeToString() + header_part.SerializeToString()
+    payload = b'\x0a' + _VarintBytes(len(cell_bytes)) + cell_bytes
+
+    assert fields(wire.wild_pokemons(payload)) == fields(expected_pokemons(payload))
+    assert set(row[0] for row in wire.iter_wild_pokemons(payload)) == set([cell.s2_cell_id])
+
+
+def test_get_status():
+    response = make_response(cells=1)
+    assert wire.get_status(response.SerializeToString()) == 1
+    response.status = 2
+    assert wire.get_status(response.SerializeToString()) == 2
+    assert wire.get_status(get_class(GetMapObjectsResponse)().SerializeToString()) == 0
+
+
+def test_split_envelope():
+    envelope = get_class(ResponseEnvelope)()
+    envelope.status_code = 1
+    envelope.request_id = 8145806132888207460
+    envelope.api_url = 'pgorelease.nianticlabs.com/plfe/403'
+    returns = [make_response(cells=1).SerializeToString(), b'', b'\x08\x01']
+    envelope.returns.extend(returns)
+
+    header, split = wire.split_envelope(envelope.SerializeToString())
+    assert [bytes(part) for part in split] == returns
+
+    parsed = get_class(ResponseEnvelope)()
+    parsed.ParseFromString(header)
+    envelope.ClearField('returns')
+    assert parsed == envelope
+
+
+def test_wild_pokemon_array():
+    np = pytest.importorskip('numpy')
+    payload = make_response().SerializeToString()
+    array = wire.wild_pokemon_array(payload)
+    expected = expected_pokemons(payload)
+    assert len(array) == len(expected)
+    assert array['encounter_id'].tolist() == [p.encounter_id for p in expected]
+    assert array['disappear_ms'].tolist() == [p.disappear_ms for p in expected]
+    assert np.allclose(array['latitude'], [p.latitude for p in expected])
+
+
+@pytest.mark.parametrize('cut', [1, 2, 10, 50, -1])
+def test_truncated_payload(cut):
+    payload = make_response(cells=1).SerializeToString()
+    with pytest.raises(wire.WireError):
+        wire.wild_pokemons(payload[:cut] if cut > 0 else payload[:cut - 3], now_ms=1)